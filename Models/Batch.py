@@ -0,0 +1,59 @@
+"""Пакет записей одной модели в виде столбцов"""
+
+
+class Batch:
+    """
+    Записи одной страницы для одной модели: по списку на каждое поле из model.FIELDS\n
+    Parsers собирают страницу сразу в столбцы, SqlAlc берёт из них кортежи для executemany без объектов моделей.
+    Для совместимости с кодом, ожидающим списки объектов, Batch поддерживает len, индексацию и итерацию,
+    объекты моделей при этом создаются по требованию
+    """
+
+    __slots__ = ("model", "fields", "columns", "__appends")
+
+    def __init__(self, model, columns=None):
+        """
+        :param model: класс модели, наследник Models.BaseModel.Base
+        :param columns: словарь {поле: список значений} для всех полей model.FIELDS, по умолчанию пустой пакет
+        """
+        self.model = model
+        self.fields = model.FIELDS
+        self.columns = columns if columns is not None else {f: [] for f in self.fields}
+        self.__appends = tuple(self.columns[f].append for f in self.fields)
+
+    def append(self, row):
+        """Добавляет запись из кортежа значений в порядке FIELDS"""
+        for append, value in zip(self.__appends, row):
+            append(value)
+
+    def extend(self, other):
+        """Добавляет в конец все записи пакета other той же модели"""
+        for f in self.fields:
+            self.columns[f].extend(other.columns[f])
+
+    def column(self, field):
+        return self.columns[field]
+
+    def rows(self, fields=None):
+        """Список кортежей значений fields (по умолчанию FIELDS) по записям, например для executemany"""
+        return list(zip(*(self.columns[f] for f in (fields or self.fields))))
+
+    def select(self, indexes):
+        """Новый пакет из записей с номерами indexes, в их порядке"""
+        return Batch(self.model, {f: [c[i] for i in indexes] for f, c in self.columns.items()})
+
+    def __len__(self):
+        return len(self.columns["uid"])
+
+    def __getitem__(self, i):
+        return self.model.from_row(tuple(self.columns[f][i] for f in self.fields))
+
+    def __iter__(self):
+        return (self.model.from_row(row) for row in zip(*(self.columns[f] for f in self.fields)))
+
+    def __reduce__(self):
+        """Для pickle (ParsePool) достаточно модели и столбцов"""
+        return Batch, (self.model, self.columns)
+
+    def __repr__(self):
+        return f"Batch[{self.model.__name__}] of {len(self)}"
@@ -6,6 +6,9 @@ from Models.BaseModel import Base
 
 
 class Hospital(Base):
+    __slots__ = ("name", "type_id", "property_form", "status", "is_archive", "tax_code", "corp_id", "center_id",
+                 "br_nick", "phones")
+
     def __init__(self, name: str, uid: int, type_id: int,
                  property_form=None, status="Active", is_archive=0,
                  tax_code=None, corp_id=None, center_id=None, br_nick=None,
@@ -32,6 +35,8 @@ class Hospital(Base):
 
 
 class HospitalType(Base):
+    __slots__ = ("name", "parent_id")
+
     def __init__(self, name: str, uid: int, parent_id: int, update_time=None):
         super().__init__(uid, update_time=update_time)
         self.name = name
@@ -46,6 +51,9 @@ class HospitalType(Base):
 
 
 class Address(Base):
+    __slots__ = ("country", "area", "region", "city", "street", "building", "house", "flat", "hosp_id", "city_id",
+                 "type_street")
+
     def __init__(self, uid: int, country=None, area=None, region=None,
                  city=None, street=None, building=None,
                  house=None, flat=None, hosp_id=None, city_id=None,
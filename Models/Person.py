@@ -6,6 +6,8 @@ from Models.BaseModel import Base
 class Person(Base):
     """Представляет одного человека"""
 
+    __slots__ = ("firstname", "lastname", "secondname", "status", "is_archive", "sex")
+
     def __init__(self, firstname: str, lastname: str, secondname: str, uid: int,
                  update_time=None, status="Активный", is_archive=0, sex=1):
         super().__init__(uid, update_time)
@@ -28,6 +30,8 @@ class Person(Base):
 class Spec(Base):
     """Представляет информацию о специальности одного человека Person"""
 
+    __slots__ = ("name", "category", "is_main")
+
     def __init__(self, name: str, uid: int,
                  category=0, is_main=1, update_time=None):
         super().__init__(uid, update_time)
@@ -45,6 +49,8 @@ class Spec(Base):
 class Post(Base):
     """Представляет информацию о должности в конкретной организации Hospital"""
 
+    __slots__ = ("name", "type")
+
     def __init__(self, name: str, type_name: str, uid: int, update_time=None):
         super().__init__(uid, update_time=update_time)
         self.name = name
@@ -62,6 +68,8 @@ class Job(Base):
     """Представляет информацию о месте работы человека Person в органицазии Hospital,
     соответсвующей должности Post"""
 
+    __slots__ = ("person_id", "is_main", "is_archive", "post_id", "status", "org_id")
+
     def __init__(self, post_id: int, person_id: int, uid: int,
                  org_id=None, is_main=1, status="Активный",
                  is_archive=0, update_time=None):
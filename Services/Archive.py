@@ -0,0 +1,136 @@
+"""Запись страниц ответов API в архив и повторная загрузка из него без обращения к серверу"""
+import datetime
+import gzip
+import os
+import threading
+import time
+import zlib
+
+from Settings.Logger import *
+from Services.ProximaHelpers import *
+from Services.Pipeline import Pipeline
+import Services.ProximaJson as ProximaJson
+
+
+class ResponseArchive:
+    """
+    Записывает страницы ответов API в сжатые NDJSON файлы, одна строка на страницу:
+    {"method": ..., "update": ..., "skip": ..., "ts": ..., "data": {"fetch": ..., "more": ..., "result": [...]}}\n
+    Каждый запуск пишет в каталоге path отдельный файл {время запуска}.ndjson.gz, старые файлы не изменяются,
+    поэтому файл упавшего запуска не портит остальные. После каждой страницы файл сбрасывается на диск,
+    при падении в нём теряется только страница, которая записывалась в этот момент
+    """
+
+    SUFFIX = ".ndjson.gz"
+
+    def __init__(self, path, compresslevel=6):
+        """
+        :param path: каталог архива, создаётся, если его нет
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.file = os.path.join(path, f"{datetime.datetime.now():%Y%m%d-%H%M%S-%f}{ResponseArchive.SUFFIX}")
+        self.__lock = threading.Lock()
+        self.__file = gzip.open(self.file, "xt", encoding="utf-8", compresslevel=compresslevel)
+
+    def record(self, method, skip, payload, update=None):
+        """
+        :param method: тип запроса из ProximaHelpers.ProximaMethods
+        :param skip: смещение страницы
+        :param payload: ResponsePayload со статусом OK
+        :param update: время последнего обновления, для недавних записей
+        """
+        line = ProximaJson.dumps({"method": method, "update": update, "skip": skip, "ts": int(time.time()),
+                                  "data": {"fetch": payload.fetch, "more": payload.is_more,
+                                           "result": payload.result}})
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.write("\n")
+            self.__file.flush()  # Z_SYNC_FLUSH: всё записанное до этого места читается и из оборванного файла
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class ProximaReplay:
+    """
+    Источник данных с тем же интерфейсом get_*, что и ProximaREST, но читающий страницы из ResponseArchive\n
+    Страницы проходят через те же Parsers и callback, запись идёт через Pipeline
+    """
+
+    def __init__(self, path, writers=1, queue_size=16, coalesce=0, linger=5.0):
+        self.path = path
+        self.writers = writers
+        self.queue_size = queue_size
+        self.coalesce = coalesce
+        self.linger = linger
+        self.checkpoint = None
+        self.failed = False  # True, если при последнем воспроизведении не удалось записать какие-то страницы
+
+    def close(self):
+        pass
+
+    def files(self):
+        """Файлы архива в порядке запусков: все файлы каталога ResponseArchive или один файл path"""
+        if not os.path.isdir(self.path):
+            return [self.path]
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                      if name.endswith(ResponseArchive.SUFFIX))
+
+    def pages(self, method):
+        """
+        Все записанные страницы метода в порядке записи\n
+        Файл, оборванный упавшим запуском, читается до последней целой страницы
+        """
+        for path in self.files():
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.endswith("\n"): break  # недописанная последняя строка
+                        if not line.strip(): continue
+                        page = ProximaJson.loads(line)
+                        if page["method"] == method:
+                            yield page
+            except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+                logger.warning(f"{path} is cut off, pages after the last complete one are skipped: {e}")
+
+    def __replay(self, method, parser, callback, skip, nmax):
+        logger.info(f"Replaying {method} from {self.path}.")
+        end = None if nmax is None else skip + nmax
+        count = 0
+        with Pipeline(callback if callback else lambda *items: None, self.queue_size, self.writers,
+                      self.coalesce, self.linger) as pipeline:
+            for page in self.pages(method):
+                if page["skip"] < skip or end is not None and page["skip"] >= end: continue
+                payload = ResponsePayload(ProcessingStatus.OK, page["data"])
+                if payload.status == ProcessingStatus.EMPTY: continue
+                pipeline.put(*parser(payload.result, from_timestamp(page["ts"])))  # время получения страницы
+                count += 1
+        self.failed = pipeline.errors != 0  # все страницы уже записаны при выходе из with
+        logger.info(f"Replayed {count} pages.")
+        return False
+
+    def get_recent_hospitals(self, callback, skip=0, nmax=None, update=0):
+        return self.__replay(ProximaMethods.hospitals(True), Parsers.recent_hospitals, callback, skip, nmax)
+
+    def get_hospitals(self, callback, skip=0, nmax=None, update=None):
+        return self.__replay(ProximaMethods.hospitals(), Parsers.hospitals, callback, skip, nmax)
+
+    def get_recent_persons(self, callback, skip=0, nmax=None, update=0):
+        return self.__replay(ProximaMethods.persons(True), Parsers.recent_persons, callback, skip, nmax)
+
+    def get_persons(self, callback, skip=0, nmax=None, update=None):
+        return self.__replay(ProximaMethods.persons(), Parsers.persons, callback, skip, nmax)
+
+    def get_recent_jobs(self, callback, skip=0, nmax=None, update=0):
+        return self.__replay(ProximaMethods.jobs(True), Parsers.recent_jobs, callback, skip, nmax)
+
+    def get_jobs(self, callback, skip=0, nmax=None, update=None):
+        return self.__replay(ProximaMethods.jobs(), Parsers.jobs, callback, skip, nmax)
+
+    def get_posts(self, callback, skip=0, nmax=None):
+        return self.__replay(ProximaMethods.posts(), Parsers.posts, callback, skip, nmax)
+
+    def get_types(self, callback, skip=0, nmax=None):
+        return self.__replay(ProximaMethods.types(), Parsers.types, callback, skip, nmax)
@@ -0,0 +1,152 @@
+"""Пропуск записей, которые не изменились с прошлой загрузки"""
+import sqlite3
+import threading
+from hashlib import blake2b
+
+from Settings.Logger import *
+from Models.BaseModel import Base
+from Models.Batch import Batch
+
+
+class ChangeIndex:
+    """
+    Локальная SQLite база uid -> 64-битный хэш содержимого записи, отдельно для каждого типа записей\n
+    Хэш считается по всем полям модели, кроме update_time, поэтому не меняется, пока не изменились данные.
+    Хэши записей, которые пишутся в теневые таблицы полной загрузки, откладываются (defer) и заменяют
+    сохранённые только вместе с таблицами (commit)
+    """
+
+    __CHUNK = 900  # SQLite ограничивает число параметров одного запроса
+
+    def __init__(self, path="Settings/changes.db"):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__deferred = set()  # типы записей, хэши которых пишутся в pending
+        self.__cnxn = sqlite3.connect(path, check_same_thread=False)
+        for table in ("hashes", "pending"):
+            self.__cnxn.execute(f"CREATE TABLE IF NOT EXISTS {table} (entity TEXT NOT NULL, uid INTEGER NOT NULL, "
+                                f"hash INTEGER NOT NULL, PRIMARY KEY (entity, uid)) WITHOUT ROWID")
+        self.__cnxn.commit()
+
+    @staticmethod
+    def digest(row):
+        """64-битный хэш кортежа значений, одинаковый между запусками (в отличие от встроенного hash)"""
+        return int.from_bytes(blake2b(repr(row).encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+    def hashes(self, entity, uids):
+        """Словарь uid -> сохранённый хэш для тех uids, которые есть в индексе"""
+        uids = list(uids)
+        result = {}
+        with self.__lock:
+            table = self.__table(entity)
+            for i in range(0, len(uids), ChangeIndex.__CHUNK):
+                chunk = uids[i:i + ChangeIndex.__CHUNK]
+                result.update(self.__cnxn.execute(
+                    f"SELECT uid, hash FROM {table} WHERE entity=? AND uid IN ({','.join('?' * len(chunk))})",
+                    (entity, *chunk)))
+        return result
+
+    def update(self, entity, pairs):
+        """Сохраняет хэши, pairs - последовательность (uid, hash)"""
+        with self.__lock:
+            self.__cnxn.executemany(f"INSERT OR REPLACE INTO {self.__table(entity)} (entity, uid, hash) "
+                                    f"VALUES (?, ?, ?)", ((entity, uid, h) for uid, h in pairs))
+            self.__cnxn.commit()
+
+    def reset(self, *entities):
+        """Забывает хэши entities, например когда таблица в БД очищена и её нужно заполнить заново"""
+        with self.__lock:
+            self.__cnxn.executemany("DELETE FROM hashes WHERE entity=?", ((e,) for e in entities))
+            self.__cnxn.commit()
+
+    def __table(self, entity):
+        return "pending" if entity in self.__deferred else "hashes"
+
+    def defer(self, *entities):
+        """
+        Откладывает хэши entities до commit или discard, например на время полной загрузки в теневые таблицы\n
+        Пока отложенные хэши не подтверждены, ChangeFilter сравнивает записи entities только с ними,
+        а сохранённые хэши не меняются. Хэши, отложенные и не подтверждённые раньше, забываются
+        """
+        with self.__lock:
+            self.__cnxn.executemany("DELETE FROM pending WHERE entity=?", ((e,) for e in entities))
+            self.__cnxn.commit()
+            self.__deferred.update(entities)
+
+    def commit(self, *entities):
+        """Заменяет все сохранённые хэши entities отложенными, когда теневые таблицы заменили рабочие"""
+        with self.__lock:
+            for entity in entities:
+                self.__cnxn.execute("DELETE FROM hashes WHERE entity=?", (entity,))
+                self.__cnxn.execute("INSERT INTO hashes (entity, uid, hash) "
+                                    "SELECT entity, uid, hash FROM pending WHERE entity=?", (entity,))
+                self.__cnxn.execute("DELETE FROM pending WHERE entity=?", (entity,))
+            self.__cnxn.commit()
+            self.__deferred.difference_update(entities)
+
+    def discard(self, *entities):
+        """Забывает отложенные хэши entities, когда полная загрузка не заменила рабочие таблицы"""
+        with self.__lock:
+            self.__cnxn.executemany("DELETE FROM pending WHERE entity=?", ((e,) for e in entities))
+            self.__cnxn.commit()
+            self.__deferred.difference_update(entities)
+
+    def close(self):
+        with self.__lock:
+            self.__cnxn.close()
+
+
+class ChangeFilter:
+    """
+    Обёртка над callback загрузки: из пакетов убираются записи, хэш которых совпадает с ChangeIndex\n
+    Хэши записанных записей сохраняются в индекс только после успешного вызова callback, поэтому
+    страница, которую не удалось записать, в следующий раз будет записана снова
+    """
+
+    def __init__(self, callback, index):
+        """
+        :param callback: функция сохранения страницы, та же, что передаётся в ProximaREST.get_*
+        :param index: ChangeIndex
+        """
+        self.callback = callback
+        self.index = index
+        self.skipped = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, *items):
+        changes, filtered = [], []
+        for batch in items:
+            batch, entity, pairs = self.__filter(batch)
+            filtered.append(batch)
+            if pairs: changes.append((entity, pairs))
+        self.callback(*filtered)
+        for entity, pairs in changes:
+            self.index.update(entity, pairs)
+
+    def __filter(self, items):
+        if len(items) == 0:
+            return items, None, None
+        model = items.model if isinstance(items, Batch) else type(items[0])
+        fields = tuple(f for f in model.FIELDS if f != "update_time")
+        rows = items.rows(fields) if isinstance(items, Batch) else list(map(Base.getter(fields), items))
+        entity = model.__name__
+
+        stored = self.index.hashes(entity, (row[0] for row in rows))
+        keep, pairs = [], []
+        for i, row in enumerate(rows):
+            digest = ChangeIndex.digest(row)
+            if stored.get(row[0]) != digest:
+                keep.append(i)
+                pairs.append((row[0], digest))
+
+        skipped = len(rows) - len(keep)
+        if skipped:
+            with self.__lock:
+                self.skipped[entity] = self.skipped.get(entity, 0) + skipped
+            items = items.select(keep) if isinstance(items, Batch) else [items[i] for i in keep]
+        return items, entity, pairs
+
+    def report(self):
+        """Пишет в лог, сколько неизменившихся записей каждого типа не было записано"""
+        if self.skipped:
+            logger.info(f"Unchanged records skipped: {', '.join(f'{k} {v}' for k, v in self.skipped.items())}.")
@@ -0,0 +1,39 @@
+"""Сохранение прогресса долгих загрузок, чтобы после падения продолжить с того же места"""
+import sqlite3
+import threading
+
+
+class CheckpointStore:
+    """
+    Хранит в локальной SQLite базе смещения страниц, которые уже загружены и записаны в БД\n
+    Записи одной загрузки удаляются, когда она завершается без ошибок
+    """
+
+    def __init__(self, path="Settings/checkpoint.db"):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__cnxn = sqlite3.connect(path, check_same_thread=False)
+        self.__cnxn.execute("CREATE TABLE IF NOT EXISTS pages (entity TEXT NOT NULL, skip INTEGER NOT NULL, "
+                            "PRIMARY KEY (entity, skip)) WITHOUT ROWID")
+        self.__cnxn.commit()
+
+    def done(self, entity):
+        """Множество смещений страниц entity, которые уже записаны"""
+        with self.__lock:
+            return {row[0] for row in self.__cnxn.execute("SELECT skip FROM pages WHERE entity=?", (entity,))}
+
+    def mark(self, entity, skip):
+        """Отмечает, что страница skip записана в БД"""
+        with self.__lock:
+            self.__cnxn.execute("INSERT OR IGNORE INTO pages (entity, skip) VALUES (?, ?)", (entity, skip))
+            self.__cnxn.commit()
+
+    def reset(self, entity):
+        """Удаляет прогресс entity, следующая загрузка начнётся сначала"""
+        with self.__lock:
+            self.__cnxn.execute("DELETE FROM pages WHERE entity=?", (entity,))
+            self.__cnxn.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__cnxn.close()
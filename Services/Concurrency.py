@@ -0,0 +1,94 @@
+"""Подстройка числа одновременных запросов к API под задержку и ошибки сервера"""
+import threading
+import time
+
+from Settings.Logger import *
+
+
+class AimdController:
+    """
+    Ограничивает число одновременных запросов (AIMD)\n
+    Пока задержки и ошибки в норме, предел растёт примерно на increase за каждые limit успешных запросов,
+    после таймаута, ответа 5xx или 429 или задержки выше latency_factor * базовая задержка - умножается на decrease
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None, increase=1.0, decrease=0.5, latency_factor=3.0,
+                 min_latency=1.0, cooldown=None):
+        """
+        :param maximum: верхний предел числа одновременных запросов (число потоков загрузки)
+        :param minimum: нижний предел
+        :param initial: начальный предел, по умолчанию половина maximum
+        :param latency_factor: во сколько раз задержка может превышать базовую, прежде чем предел снизится
+        :param min_latency: задержка в секундах, которая никогда не считается признаком перегрузки
+        :param cooldown: минимальное время в секундах между двумя снижениями, по умолчанию базовая задержка
+        """
+        self.maximum = max(maximum, 1)
+        self.minimum = min(max(minimum, 1), self.maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_latency = min_latency
+        self.cooldown = cooldown
+        self.base_latency = None
+        self.requests = 0
+        self.errors = 0
+        self.__limit = float(initial if initial is not None else max(self.minimum, self.maximum // 2))
+        self.__limit = min(max(self.__limit, self.minimum), self.maximum)
+        self.__in_flight = 0
+        self.__last_decrease = 0.0
+        self.__cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """Текущий предел числа одновременных запросов"""
+        return int(self.__limit)
+
+    @property
+    def in_flight(self):
+        return self.__in_flight
+
+    def acquire(self):
+        """Ждёт, пока число выполняющихся запросов не станет меньше предела"""
+        with self.__cond:
+            while self.__in_flight >= int(self.__limit):
+                self.__cond.wait()
+            self.__in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, ok=True, latency=None):
+        """
+        Учитывает результат запроса и освобождает место\n
+        :param started: значение, которое вернул acquire
+        :param ok: False для таймаута, разрыва соединения или ответа, которым сервер сообщает о перегрузке
+            (5xx, 408, 425, 429)
+        :param latency: время получения страницы данных. None для ответов, которые нельзя сравнивать
+            со страницами: быстрых IN_PROGRESS, опросов getwait, ошибок. Базовая задержка строится только
+            по страницам, иначе быстрые ответы занизили бы её и обычная страница казалась бы перегрузкой
+        """
+        with self.__cond:
+            self.__in_flight -= 1
+            self.requests += 1
+            old = int(self.__limit)
+
+            if ok and latency is not None and self.base_latency is not None and \
+                    latency > max(self.base_latency * self.latency_factor, self.min_latency):
+                ok = False
+            if ok:
+                if latency is not None:
+                    self.base_latency = latency if self.base_latency is None else \
+                        min(latency, self.base_latency * 0.9 + latency * 0.1)
+                self.__limit = min(self.__limit + self.increase / max(self.__limit, 1.0), self.maximum)
+            else:
+                self.errors += 1
+                cooldown = self.cooldown if self.cooldown is not None else (self.base_latency or 0)
+                now = time.monotonic()
+                if now - self.__last_decrease >= cooldown:
+                    self.__limit = max(self.__limit * self.decrease, self.minimum)
+                    self.__last_decrease = now
+
+            if int(self.__limit) != old:
+                logger.log(logging.DEBUG if ok else logging.INFO,
+                           f"Concurrency {old} -> {int(self.__limit)} (latency "
+                           f"{time.monotonic() - started if latency is None else latency:.1f}s, "
+                           f"{self.errors}/{self.requests} failed).")
+            self.__cond.notify_all()
@@ -0,0 +1,95 @@
+"""Удаление повторяющихся записей перед записью в БД"""
+import threading
+
+from Settings.Logger import *
+from Models.Batch import Batch
+
+
+class SeenSet:
+    """
+    Словарь uid -> update_time ограниченного размера\n
+    Хранит два поколения по capacity / 2 записей: когда текущее заполняется, оно становится старым,
+    а прежнее старое забывается целиком. Поиск и добавление за O(1), память не растёт с длиной загрузки
+    """
+
+    def __init__(self, capacity=200000):
+        self.capacity = max(capacity, 2)
+        self.__current = {}
+        self.__old = {}
+
+    def get(self, uid):
+        value = self.__current.get(uid)
+        return value if value is not None else self.__old.get(uid)
+
+    def put(self, uid, value):
+        if uid not in self.__current and len(self.__current) >= self.capacity // 2:
+            self.__old, self.__current = self.__current, {}
+        self.__current[uid] = value
+
+    def __len__(self):
+        return len(self.__current) + len(self.__old)
+
+
+class Dedup:
+    """
+    Обёртка над callback загрузки: из каждого пакета убираются записи с uid, которые уже встречались
+    в этом пакете или на прошлых страницах\n
+    Из повторов в пакете остаётся запись с самым поздним update_time, при равном - последняя в пакете, как
+    в SqlAlc.newest. Повтор с другой страницы записывается, только если он новее уже записанного: у всех записей
+    полной загрузки одно время, и перезапись равной копией с более поздней страницы только добавила бы работы БД.
+    Отдельный SeenSet на каждый аргумент callback (Person, Spec, Job...). Может вызываться из нескольких
+    потоков записи Pipeline
+    """
+
+    def __init__(self, callback, capacity=200000):
+        """
+        :param callback: функция сохранения страницы, та же, что передаётся в ProximaREST.get_*
+        :param capacity: сколько uid помнить для каждого типа записей
+        """
+        self.callback = callback
+        self.capacity = capacity
+        self.dropped = {}
+        self.__seen = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, *items):
+        self.callback(*(self.__filter(i, batch) for i, batch in enumerate(items)))
+
+    def __filter(self, position, items):
+        if len(items) == 0:
+            return items
+        if isinstance(items, Batch):
+            name, uids, times = items.model.__name__, items.column("uid"), items.column("update_time")
+        else:
+            name, uids, times = type(items[0]).__name__, [t.uid for t in items], [t.update_time for t in items]
+
+        latest = {}  # uid -> номер самой поздней записи в пакете
+        for i, (uid, time) in enumerate(zip(uids, times)):
+            j = latest.get(uid)
+            if j is None or times[j] <= time:
+                latest[uid] = i
+
+        keep = []
+        with self.__lock:
+            seen = self.__seen.setdefault(position, SeenSet(self.capacity))
+            for uid, i in latest.items():
+                previous = seen.get(uid)
+                if previous is not None and previous >= times[i]:
+                    continue
+                seen.put(uid, times[i])
+                keep.append(i)
+            dropped = len(uids) - len(keep)
+            if dropped: self.dropped[name] = self.dropped.get(name, 0) + dropped
+
+        if not dropped:
+            return items
+        keep.sort()
+        logger.debug(f"Dropped {dropped} duplicate {name} records.")
+        return items.select(keep) if isinstance(items, Batch) else [items[i] for i in keep]
+
+    def report(self):
+        """Пишет в лог, сколько повторов каждого типа записей было удалено"""
+        if self.dropped:
+            logger.info(f"Dropped duplicates: {', '.join(f'{k} {v}' for k, v in self.dropped.items())}.")
+        else:
+            logger.info("No duplicates found.")
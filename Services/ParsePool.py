@@ -0,0 +1,69 @@
+"""Разбор страниц в отдельных процессах, чтобы декодирование JSON и Parsers не ограничивались GIL"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from Services.ProximaHelpers import *
+import Services.ProximaJson as ProximaJson
+
+
+def parse_page(content, method, parser, decoder=None):
+    """
+    Выполняется в процессе пула: декодирует тело ответа с HTTP 200, проверяет его и разбирает parser\n
+    Строки страницы обратно не передаются, только пакеты Batch, которые сериализуются столбцами.
+    Одинаковые строки внутри пакета после Serializers - один объект, pickle передаёт их один раз
+    :param content: тело ответа, bytes
+    :param method: тип запроса из ProximaHelpers.ProximaMethods
+    :param parser: функция из ProximaHelpers.Parsers, может быть functools.partial с update_time
+    :param decoder: функция вида f(bytes) -> dict, по умолчанию ProximaJson.loads
+    :return: ResponsePayload с разобранными пакетами в items
+    """
+    info = (decoder or ProximaJson.loads)(content)
+    check_status(200, info, method)
+    payload = ResponsePayload(ProcessingStatus.OK, info[method])
+    if payload.status == ProcessingStatus.OK:
+        payload.items = parser(payload.result)
+        payload.result = None
+    return payload
+
+
+class ParsePool:
+    """
+    Пул процессов, разбирающих полученные страницы\n
+    Поток загрузки отправляет тело ответа в пул и ждёт результата, не удерживая GIL, поэтому разбор
+    идёт на workers ядрах. Процессы запускаются при первой странице методом spawn: на всех платформах
+    одинаково и без копирования блокировок потоков загрузки. parser и decoder должны сериализоваться
+    pickle, то есть быть функциями уровня модуля или класса (Parsers.*), а не lambda
+    """
+
+    def __init__(self, workers, decoder=None):
+        """
+        :param workers: число процессов
+        :param decoder: функция вида f(bytes) -> dict, по умолчанию ProximaJson.loads
+        """
+        self.workers = workers
+        self.decoder = decoder
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def __get(self):
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            return self.__executor
+
+    def submit(self, content, method, parser):
+        """concurrent.futures.Future с результатом parse_page, для asyncio - через asyncio.wrap_future"""
+        return self.__get().submit(parse_page, content, method, parser, self.decoder)
+
+    def parse(self, content, method, parser):
+        """Разбирает страницу в пуле и ждёт результата, ошибки parse_page возникают здесь же"""
+        return self.submit(content, method, parser).result()
+
+    def close(self):
+        """Останавливает процессы пула"""
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown()
+                self.__executor = None
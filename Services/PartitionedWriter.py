@@ -0,0 +1,51 @@
+"""Параллельная запись одной страницы несколькими соединениями с БД"""
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+from Models.Batch import Batch
+
+
+class PartitionedWriter:
+    """
+    Обёртка над callback загрузки: каждый пакет делится на writers частей по uid % writers,
+    части пишутся параллельно, каждая своим потоком и своим соединением\n
+    Записи с одним uid всегда попадают в один поток, поэтому потоки не конкурируют за одни строки
+    и порядок записи одного uid сохраняется. Вызов ждёт записи всех частей, так что Pipeline, ChangeFilter
+    и CheckpointStore видят страницу записанной только целиком. Ошибка любой части возникает в вызове
+    """
+
+    def __init__(self, callback, writers=4):
+        """
+        :param callback: функция сохранения страницы, та же, что передаётся в ProximaREST.get_*, потокобезопасная
+        :param writers: число потоков записи, для SqlAlc - не больше его writers (размера пула соединений)
+        """
+        self.callback = callback
+        self.writers = max(writers, 1)
+        self.__executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"proxima-db-{i}")
+                            for i in range(self.writers if self.writers > 1 else 0)]
+
+    def __call__(self, *items):
+        if self.writers == 1:
+            self.callback(*items)
+            return
+        parts = [self.__split(batch) for batch in items]
+        futures = [executor.submit(self.callback, *(p[k] for p in parts))
+                   for k, executor in enumerate(self.__executors) if any(len(p[k]) for p in parts)]
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+    def __split(self, items):
+        """Части пакета items по номеру потока"""
+        indexes = [[] for _ in range(self.writers)]
+        uids = items.column("uid") if isinstance(items, Batch) else [t.uid for t in items]
+        for i, uid in enumerate(uids):
+            indexes[uid % self.writers].append(i)
+        if isinstance(items, Batch):
+            return [items.select(part) for part in indexes]
+        return [[items[i] for i in part] for part in indexes]
+
+    def close(self):
+        """Останавливает потоки записи"""
+        for executor in self.__executors:
+            executor.shutdown()
@@ -0,0 +1,112 @@
+"""Конвейер загрузка -> запись: страницы передаются писателям через ограниченную очередь"""
+import queue
+import threading
+import time
+
+from Settings.Logger import *
+from Models.Batch import Batch
+
+
+class Pipeline:
+    """
+    Потоки загрузки кладут разобранные страницы в очередь (put), потоки записи параллельно вызывают для них callback\n
+    Когда очередь заполнена, put блокируется, пока запись не догонит загрузку.
+    С coalesce > 0 поток записи объединяет несколько страниц в один вызов callback (write-behind): число
+    транзакций и коммитов зависит от объёма данных, а не от числа страниц. done страниц вызываются
+    только после записи объединённого пакета
+    """
+
+    __STOP = object()
+
+    def __init__(self, callback, size=16, writers=1, coalesce=0, linger=5.0):
+        """
+        :param callback: функция сохранения страницы, та же, что передаётся в ProximaREST.get_*
+        :param size: максимальное число страниц, ожидающих записи
+        :param writers: число потоков записи. При writers > 1 callback должен быть потокобезопасным
+        :param coalesce: сколько записей одного аргумента callback (одной таблицы) копить из нескольких страниц,
+            прежде чем вызвать callback один раз для всех. 0 - callback на каждую страницу
+        :param linger: сколько секунд первая страница может ждать в буфере, пока он не набрал coalesce записей
+        """
+        self.callback = callback
+        self.writers = max(writers, 1)
+        self.coalesce = coalesce
+        self.linger = linger
+        self.errors = 0
+        self.__errors_lock = threading.Lock()
+        self.__queue = queue.Queue(maxsize=max(size, 1))
+        self.__threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        for i in range(self.writers):
+            t = threading.Thread(target=self.__write, name=f"proxima-writer-{i}", daemon=True)
+            t.start()
+            self.__threads.append(t)
+
+    def put(self, *items, done=None):
+        """
+        Ставит страницу в очередь на запись, ждёт, если очередь заполнена\n
+        :param done: функция без аргументов, вызывается после успешной записи страницы
+        """
+        self.__queue.put((items, done))
+
+    def close(self):
+        """Дожидается записи всех страниц из очереди и буферов и останавливает потоки записи"""
+        for _ in self.__threads:
+            self.__queue.put(Pipeline.__STOP)
+        for t in self.__threads:
+            t.join()
+        self.__threads = []
+
+    def __write(self):
+        pages, counts, deadline = [], None, None
+        while True:
+            try:
+                page = self.__queue.get(timeout=max(deadline - time.monotonic(), 0) if pages else None)
+            except queue.Empty:
+                page = None  # первая страница буфера ждёт дольше linger
+            if page is Pipeline.__STOP:
+                self.__flush(pages)
+                return
+            if page is not None:
+                if not pages: counts, deadline = [0] * len(page[0]), time.monotonic() + self.linger
+                pages.append(page)
+                counts = [c + len(items) for c, items in zip(counts, page[0])]
+            if page is None or self.coalesce <= 0 or max(counts, default=0) >= self.coalesce:
+                self.__flush(pages)
+                pages = []
+
+    def __flush(self, pages):
+        """Записывает накопленные страницы одним вызовом callback и вызывает их done"""
+        if not pages:
+            return
+        items = pages[0][0] if len(pages) == 1 else Pipeline.__merge([items for items, _ in pages])
+        try:
+            self.callback(*items)
+            for _, done in pages:
+                if done is not None: done()
+            logger.debug(f"Saved {list(map(len, items))} items from {len(pages)} pages, "
+                         f"{self.__queue.qsize()} pages in queue.")
+        except Exception as e:
+            with self.__errors_lock:  # потоков записи может быть несколько
+                self.errors += 1
+            logger.error(e)
+
+    @staticmethod
+    def __merge(pages):
+        """Объединяет страницы по аргументам callback: пакеты Batch - по столбцам, списки - подряд"""
+        merged = []
+        for parts in zip(*pages):
+            if isinstance(parts[0], Batch):
+                batch = Batch(parts[0].model)
+                for part in parts: batch.extend(part)
+            else:
+                batch = [obj for part in parts for obj in part]
+            merged.append(batch)
+        return merged
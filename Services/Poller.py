@@ -0,0 +1,167 @@
+"""Отслеживание запросов, данные по которым сервер ещё готовит (getwait, статус IN_PROGRESS)"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Settings.Logger import *
+from Services.ProximaHelpers import WaitingException
+from Services.Retry import RetryPolicy
+
+
+class ReadinessModel:
+    """
+    Подбирает интервалы опроса: сначала короткие, затем с увеличением до max_interval\n
+    Первый опрос планируется по среднему наблюдаемому времени подготовки данных
+    """
+
+    def __init__(self, min_interval=5, max_interval=120, backoff=2.0, smoothing=0.3):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.ready_time = None
+        self.__lock = threading.Lock()
+
+    def first(self):
+        """Интервал до первого опроса"""
+        if self.ready_time is None:
+            return self.min_interval
+        return min(max(self.min_interval, self.ready_time * 0.8), self.max_interval)
+
+    def next(self, interval):
+        """Интервал до следующего опроса, если данные всё ещё не готовы"""
+        return min(max(interval * self.backoff, self.min_interval), self.max_interval)
+
+    def observe(self, elapsed):
+        """Учитывает время, за которое сервер подготовил данные"""
+        with self.__lock:
+            if self.ready_time is None: self.ready_time = elapsed
+            else: self.ready_time += self.smoothing * (elapsed - self.ready_time)
+
+
+class AwaitingPoller:
+    """
+    Опрашивает все object_id, по которым данные ещё не готовы\n
+    Потоки загрузки регистрируют object_id через submit и продолжают загружать другие страницы.
+    Отдельный поток только планирует опросы, сами опросы и on_ready выполняют workers потоков,
+    поэтому медленный разбор страницы или ожидание места в очереди записи не задерживают остальные опросы
+    """
+
+    def __init__(self, poll, model=None, retry=None, capacity=64, workers=4):
+        """
+        :param poll: функция вида f(object_id, method, attempt) -> dict, возвращающая данные метода
+            или вызывающая WaitingException, если они ещё не готовы
+        :param model: ReadinessModel, задающая интервалы опроса
+        :param retry: RetryPolicy для опросов, завершившихся ошибкой
+        :param capacity: максимальное число одновременно ожидаемых object_id, submit ждёт, если их больше
+        :param workers: число потоков, выполняющих опросы и on_ready
+        """
+        self.poll = poll
+        self.model = model if model is not None else ReadinessModel()
+        self.retry = retry if retry is not None else RetryPolicy(0)
+        self.capacity = max(capacity, 1)
+        self.__jobs = []  # куча (время следующего опроса, номер, задача)
+        self.__counter = itertools.count()
+        self.__active = 0
+        self.__cond = threading.Condition()
+        self.__thread = None
+        self.__executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="proxima-poll")
+
+    @property
+    def pending(self):
+        return self.__active
+
+    def submit(self, object_id, method, on_ready, on_error=None):
+        """
+        Начинает отслеживать object_id\n
+        :param method: тип запроса из ProximaHelpers.ProximaMethods, данные которого ожидаются
+        :param on_ready: функция вида f(data) -> None, вызывается с данными метода, когда они готовы
+        :param on_error: функция вида f(Exception) -> None, вызывается, если данные получить не удалось
+            или on_ready завершилась ошибкой
+        """
+        with self.__cond:
+            while self.__active >= self.capacity:
+                self.__cond.wait()
+            now = time.monotonic()
+            job = {"object_id": object_id, "method": method, "on_ready": on_ready, "on_error": on_error,
+                   "started": now, "interval": self.model.first(), "retries": 0}
+            heapq.heappush(self.__jobs, (now + job["interval"], next(self.__counter), job))
+            self.__active += 1
+            self.__start()
+            self.__cond.notify_all()
+        logger.debug(f"Data for {object_id} is not ready, {self.__active} requests are awaited.")
+
+    def join(self):
+        """Ждёт, пока все отслеживаемые object_id не будут получены"""
+        with self.__cond:
+            while self.__active > 0:
+                self.__cond.wait()
+
+    def close(self):
+        """Останавливает потоки опроса, ожидаемые object_id больше не опрашиваются"""
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def __start(self):
+        """Запускает поток планирования, если он не запущен. Вызывается под self.__cond"""
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name="proxima-poller", daemon=True)
+            self.__thread.start()
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while not self.__jobs:
+                    # пока идут опросы, задача может вернуться в очередь, поэтому поток завершается только без них
+                    if not self.__cond.wait(timeout=self.model.max_interval) and not self.__jobs and not self.__active:
+                        self.__thread = None  # поток завершается без работы, submit запустит новый
+                        return
+                due, _, job = self.__jobs[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.__cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self.__jobs)
+            self.__executor.submit(self.__poll, job)
+
+    def __poll(self, job):
+        try:
+            data = self.poll(job["object_id"], job["method"], job["retries"])
+        except WaitingException:
+            job["interval"] = self.model.next(job["interval"])
+            return self.__reschedule(job, job["interval"])
+        except Exception as e:
+            if self.retry.should_retry(e, job["retries"]):
+                delay = self.retry.delay(job["retries"])
+                job["retries"] += 1
+                logger.warning(f"Cannot get {job['object_id']}: {e} "
+                               f"{self.retry.retries - job['retries']} retries left.")
+                return self.__reschedule(job, delay)
+            return self.__fail(job, e)
+
+        self.model.observe(time.monotonic() - job["started"])
+        try:
+            job["on_ready"](data)
+        except Exception as e:
+            return self.__fail(job, e)
+        self.__done()
+
+    def __fail(self, job, error):
+        """Данные job не получены или не обработаны: сообщает об этом on_error"""
+        logger.error(error)
+        try:
+            if job["on_error"] is not None: job["on_error"](error)
+        finally:
+            self.__done()
+
+    def __reschedule(self, job, delay):
+        with self.__cond:
+            heapq.heappush(self.__jobs, (time.monotonic() + delay, next(self.__counter), job))
+            self.__start()
+            self.__cond.notify_all()
+
+    def __done(self):
+        with self.__cond:
+            self.__active -= 1
+            self.__cond.notify_all()
@@ -0,0 +1,278 @@
+"""Асинхронный доступ к функционалу API, альтернатива потокам ProximaREST"""
+import asyncio
+import datetime
+import time
+from functools import partial
+import aiohttp
+
+from Settings.Logger import *
+from Services.ProximaHelpers import *
+import Services.ProximaTemplates as Templates
+import Services.ProximaJson as ProximaJson
+from Services.Pipeline import Pipeline
+from Services.Poller import ReadinessModel
+from Services.Retry import RetryPolicy
+from Services.ParsePool import ParsePool
+
+
+class AsyncProximaREST:
+    """
+    Предоставляет доступ к функционалу API через asyncio\n
+    Все страницы загружаются в одном потоке, число одновременных запросов ограничено concurrency.
+    Использовать внутри asyncio.run(...) или async with AsyncProximaREST(...) as api
+    """
+
+    def __init__(self, url, key, sign, proxy=None, wait_time=120, retries=0,
+                 timeout=10, concurrency=50, writers=1, queue_size=16, min_wait_time=5, retry=None,
+                 decoder=None, parse_workers=0, coalesce=0, linger=5.0):
+        """
+        :param coalesce: сколько записей каждой таблицы Pipeline копит из нескольких страниц перед вызовом
+            обычного callback, 0 - callback на каждую страницу
+        :param linger: сколько секунд страница может ждать в буфере Pipeline, пока не набралось coalesce записей
+        :param parse_workers: число процессов ParsePool для разбора страниц, 0 - разбор в цикле событий
+        :param decoder: функция вида f(bytes) -> dict для разбора ответов, по умолчанию ProximaJson.loads
+        :param retries: число повторов каждого запроса после ошибки
+        :param timeout: таймаут первой попытки запроса, следующие попытки получают больше времени
+        :param retry: RetryPolicy, заменяет retries и timeout
+        :param wait_time: максимальный интервал между опросами данных, которые сервер ещё готовит
+        :param min_wait_time: интервал до первого опроса, пока время подготовки данных сервером неизвестно
+        :param proxy: словарь вида {"http": ..., "https": ...}, как для ProximaREST
+        :param concurrency: максимальное число страниц, загружаемых одновременно
+        :param writers: число потоков, параллельно вызывающих обычный (не async) callback
+        :param queue_size: сколько загруженных страниц может ждать записи, прежде чем загрузка приостановится
+        """
+        self.url = url
+        self.key = key
+        self.sign = sign
+        self.header = {'Token': str(self.key), 'sign': str(self.sign), 'Content-Type': 'application/json',
+                       'Accept-Encoding': 'gzip, deflate'}
+        self.wait_time = wait_time
+        self.readiness = ReadinessModel(min_wait_time, wait_time)
+        self.proxy = None if proxy is None else proxy.get(url.split(":", 1)[0])
+        self.retry = retry if retry is not None else RetryPolicy(retries, timeout)
+        self.decoder = decoder if decoder is not None else ProximaJson.loads
+        self.concurrency = concurrency
+        self.writers = writers
+        self.queue_size = queue_size
+        self.coalesce = coalesce
+        self.linger = linger
+        self.failed = False  # True, если последняя загрузка get_* не получила или не записала какие-то страницы
+        self.parse_pool = ParsePool(parse_workers, self.decoder) if parse_workers else None
+        self.__step = 1000  # Proxima не выдаёт более 1000 записей за один запрос
+        self.__session = None
+        self.__semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Закрывает все соединения и процессы ParsePool"""
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+        if self.parse_pool is not None: await asyncio.to_thread(self.parse_pool.close)
+
+    def __open(self):
+        """Сессия и примитивы синхронизации создаются внутри запущенного цикла событий"""
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(
+                headers=self.header, connector=aiohttp.TCPConnector(limit=self.concurrency))
+            self.__semaphore = asyncio.BoundedSemaphore(self.concurrency)
+
+    async def __post(self, data, timeout, raw=False):
+        """:param raw: True, чтобы вернуть тело ответа без разбора"""
+        async with self.__semaphore:
+            async with self.__session.post(self.url, data=data, proxy=self.proxy,
+                                           timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                content = await r.read()
+                return r.status, content if raw else self.decoder(content)
+
+    async def __send_request(self, template, method, parser=None):
+        """
+        Загружает одну страницу, дожидаясь готовности данных и повторяя запрос при ошибках\n
+        :param template: шаблон запроса из ProximaTemplates
+        :param method: тип запроса из ProximaHelpers.ProximaMethods
+        :param parser: если задан ParsePool, страница разбирается в нём и пакеты возвращаются в items
+        """
+        pool = self.parse_pool if parser is not None else None
+        awaiting, attempt = None, 0
+        started, interval = None, None
+        while True:
+            try:
+                if awaiting is None:
+                    status, info = await self.__post(template, self.retry.timeout(attempt), raw=pool is not None)
+                    if pool is not None and status == 200:
+                        return await asyncio.wrap_future(pool.submit(info, method, parser))
+                    if pool is not None: info = self.decoder(info)
+                    check_status(status, info, method)
+                    data = info[method]
+                else:
+                    status, info = await self.__post(Templates.awaited(awaiting), self.retry.timeout(attempt))
+                    check_status(status, info, None)
+                    data = info[ProximaMethods.awaited()]["result"][0]["recordset"][method]
+                    self.readiness.observe(time.monotonic() - started)
+                return ResponsePayload(ProcessingStatus.OK, data)
+            except WaitingException as e:
+                if awaiting is None:
+                    started, interval = time.monotonic(), self.readiness.first()
+                else:
+                    interval = self.readiness.next(interval)
+                awaiting = e.object_id
+                logger.debug(f"Data is not ready, waiting {interval:.0f}s.")
+                await asyncio.sleep(interval)
+            except Exception as e:
+                if not self.retry.should_retry(e, attempt):
+                    logger.error(e)
+                    return ResponsePayload(ProcessingStatus.ERROR)
+                delay = self.retry.delay(attempt)
+                attempt += 1
+                logger.warning(f"{e} Trying to connect again in {delay:.0f}s. "
+                               f"{self.retry.retries - attempt} retries left.")
+                await asyncio.sleep(delay)
+
+    async def __fetch(self, template, method, parser, callback, skip, nmax):
+        """
+        Загружает страницы одного метода API, держа в работе до concurrency страниц из общего PageCursor\n
+        :param template: функция вида f(skip, first) -> str, строящая запрос из ProximaTemplates
+        :param method: тип запроса из ProximaHelpers.ProximaMethods
+        :param parser: функция из ProximaHelpers.Parsers, превращающая страницу в списки объектов для callback
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        self.__open()
+        logger.info("Requesting data.")
+        cursor = PageCursor(skip, self.__step, nmax)
+        parser = partial(parser, update_time=datetime.datetime.now())  # одно время загрузки для всех записей
+
+        # обычный callback выполняется потоками Pipeline, ожидание места в очереди не блокирует цикл событий
+        if callback and not asyncio.iscoroutinefunction(callback):
+            pipeline = Pipeline(callback, self.queue_size, self.writers, self.coalesce, self.linger)
+            pipeline.start()
+
+            async def save(*items):
+                await asyncio.to_thread(pipeline.put, *items)
+        else:
+            pipeline, save = None, callback
+
+        async def worker():
+            offset = cursor.next()
+            while offset is not None:
+                payload = await self.__send_request(template(offset, self.__step), method, parser)
+                if payload.status == ProcessingStatus.ERROR:
+                    cursor.fail()
+                    return
+                if payload.status == ProcessingStatus.EMPTY or not payload.is_more:
+                    cursor.finish(offset)
+                if payload.status != ProcessingStatus.EMPTY:
+                    items = payload.items if payload.items is not None else parser(payload.result)
+                    if save: await save(*items)
+                    logger.debug(f"Received {list(map(len, items))} items from {offset}.")
+                offset = cursor.next()
+
+        workers = self.concurrency if nmax is None else min(self.concurrency, -(-nmax // self.__step))
+        tasks = [asyncio.ensure_future(worker()) for _ in range(max(workers, 1))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # остальные задачи отменяются до остановки Pipeline, иначе они продолжили бы вызывать put
+            cursor.fail()
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            if pipeline is not None: await asyncio.to_thread(pipeline.close)
+        self.failed = cursor.failed or pipeline is not None and pipeline.errors != 0
+        return cursor.is_more
+
+    async def get_recent_hospitals(self, callback, skip=0, nmax=None, update=0):
+        """
+        Список всех недавно обновлённых учреждений и их адресов\n
+        :param callback: функция или корутина вида f(list[Hospital], list[Address]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :param update: время в формате timestamp последнего обновления записей
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(lambda s, n: Templates.recent_hospitals(s, n, update),
+                                  ProximaMethods.hospitals(True), Parsers.recent_hospitals, callback, skip, nmax)
+
+    async def get_hospitals(self, callback, skip=0, nmax=None, update=None):
+        """
+        Список всех учреждений и их адресов\n
+        :param callback: функция или корутина вида f(list[Hospital], list[Address]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :param update: не используется, нужен для совместимости с ProximaREST
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(Templates.hospitals, ProximaMethods.hospitals(), Parsers.hospitals,
+                                  callback, skip, nmax)
+
+    async def get_recent_persons(self, callback, skip=0, nmax=None, update=0):
+        """
+        Список всех людей и их специальностей, недавно обновлённых в базе данных\n
+        :param callback: функция или корутина вида f(list[Person], list[Spec], list[Job]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :param update: время в формате timestamp последнего обновления записей
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(lambda s, n: Templates.recent_persons(s, n, update),
+                                  ProximaMethods.persons(True), Parsers.recent_persons, callback, skip, nmax)
+
+    async def get_persons(self, callback, skip=0, nmax=None, update=None):
+        """
+        Список всех людей и их специальностей\n
+        :param callback: функция или корутина вида f(list[Person], list[Spec], list[Job]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :param update: не используется, нужен для совместимости с ProximaREST
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(Templates.persons, ProximaMethods.persons(), Parsers.persons,
+                                  callback, skip, nmax)
+
+    async def get_recent_jobs(self, callback, skip=0, nmax=None, update=0):
+        """
+        Список всех недавно обновлённых мест работы\n
+        :param callback: функция или корутина вида f(list[Job]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :param update: время в формате timestamp последнего обновления записей
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(lambda s, n: Templates.recent_jobs(s, n, update),
+                                  ProximaMethods.jobs(True), Parsers.recent_jobs, callback, skip, nmax)
+
+    async def get_jobs(self, callback, skip=0, nmax=None, update=None):
+        """
+        Список всех мест работы\n
+        :param callback: функция или корутина вида f(list[Job]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :param update: не используется, нужен для совместимости с ProximaREST
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(Templates.jobs, ProximaMethods.jobs(), Parsers.jobs, callback, skip, nmax)
+
+    async def get_posts(self, callback, skip=0, nmax=None):
+        """
+        Список всех должностей\n
+        :param callback: функция или корутина вида f(list[Post]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(Templates.posts, ProximaMethods.posts(), Parsers.posts, callback, skip, nmax)
+
+    async def get_types(self, callback, skip=0, nmax=None):
+        """
+        Список всех типов учреждений\n
+        :param callback: функция или корутина вида f(list[HospitalType]) -> None
+        :param skip: пропускает первые записи
+        :param nmax: ограничение на общее число записей. None чтобы загружать до конца.
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        return await self.__fetch(Templates.types, ProximaMethods.types(), Parsers.types, callback, skip, nmax)
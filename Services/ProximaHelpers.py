@@ -1,18 +1,29 @@
 """Вспомогательные функции и типы для ProximaREST"""
 import datetime
+import threading
 from enum import Enum
+from sys import intern
+from functools import lru_cache
 from Models.Person import *
 from Models.Hospital import *
+from Models.Batch import Batch
+from Settings.Logger import logger
 
 
 class WaitingException(Exception):
     """Возникает, когда сервер сообщает, что даные ещё не готовы"""
-    pass
+
+    def __init__(self, message, object_id=None):
+        super().__init__(message)
+        self.object_id = object_id
 
 
 class CriticalException(Exception):
     """Возникает, когда из-за ошибки нельзя продолжить работу"""
-    pass
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
 
 
 class ProcessingStatus(Enum):
@@ -26,20 +37,101 @@ class ProcessingStatus(Enum):
 class ResponsePayload:
     """Класс, хранящий полезную информацию об ответе: статус и данные для выгрузки"""
 
-    def __init__(self, status=ProcessingStatus.EMPTY, data=None):
+    def __init__(self, status=ProcessingStatus.EMPTY, data=None, object_id=None):
+        """
+        :param object_id: для статуса WAITING - идентификатор, по которому данные можно получить позже
+        """
         self.status = status
         self.result = None
+        self.items = None  # пакеты Batch, если страница уже разобрана в ParsePool
         self.fetch = 0
         self.is_more = False
+        self.object_id = object_id
 
-        if data is None or data["fetch"] == 0:
+        if status != ProcessingStatus.OK:
+            pass
+        elif data is None or data["fetch"] == 0:
             self.status = ProcessingStatus.EMPTY
-        elif data is not None:
+        else:
             self.result = data["result"]
             self.fetch = data["fetch"]
             self.is_more = data["more"]
 
 
+def check_status(status_code, info, expected_item):
+    """
+    Проверяет ответ API\n
+    :param status_code: HTTP код ответа
+    :param info: тело ответа, разобранное из JSON
+    :param expected_item: метод, данные которого должны быть в ответе, None для ответа на getwait
+    :raise WaitingException: данные ещё не готовы, object_id нужно опросить позже
+    :raise CriticalException: ответ с HTTP кодом ошибки
+    """
+    if status_code == 201 and 'status' in info and info['status'] == 'IN_PROGRESS':
+        raise WaitingException("Data is not ready.", info["object_id"])
+
+    if status_code != 200:
+        raise CriticalException(f"Cannot get information. HTTP code {status_code}.", status_code)
+
+    if 'getwait' in info and info['getwait']['result'][0]['status'] == 'IN_PROGRESS':
+        raise WaitingException("Data is not ready.", info['getwait']['result'][0]["object_id"])
+
+    if 'resultcode' in info and info['resultcode'] == 400:
+        raise CriticalException(f"API error: {info['errormessage']}.", 400)
+
+    if expected_item is not None and expected_item not in info:
+        raise Exception(f"Cannot get information. [{info['resultcode']}] {info['errormessage']}.")
+
+
+class PageCursor:
+    """
+    Общий для потоков загрузки счётчик страниц: освободившийся поток берёт следующее смещение\n
+    Страницы выдаются, пока не достигнут nmax или пока какая-нибудь страница не окажется последней
+    """
+
+    def __init__(self, skip=0, step=1000, nmax=None, done=None):
+        """
+        :param skip: смещение первой страницы
+        :param step: размер страницы
+        :param nmax: ограничение на общее число записей, None чтобы выдавать страницы до конца данных
+        :param done: смещения страниц, которые уже загружены и не должны выдаваться снова
+        """
+        self.step = step
+        self.end = None if nmax is None else skip + nmax
+        self.finished = False
+        self.failed = False
+        self.__next = skip
+        self.__done = done if done is not None else set()
+        self.__lock = threading.Lock()
+
+    @property
+    def is_more(self):
+        """True, если остались незагруженные данные"""
+        return not self.finished
+
+    def next(self):
+        """Смещение следующей страницы или None, если страниц больше нет"""
+        with self.__lock:
+            while self.__next in self.__done:
+                self.__next += self.step
+            if self.failed or self.end is not None and self.__next >= self.end:
+                return None
+            offset = self.__next
+            self.__next += self.step
+            return offset
+
+    def finish(self, offset):
+        """Отмечает, что страница offset последняя (пустая или с more=False)"""
+        with self.__lock:
+            self.finished = True
+            self.end = offset + 1 if self.end is None else min(self.end, offset + 1)
+
+    def fail(self):
+        """Останавливает выдачу страниц после ошибки"""
+        with self.__lock:
+            self.failed = True
+
+
 class ProximaMethods:
     """Строки с именами методов для HTTP запросов к API"""
 
@@ -81,9 +173,12 @@ class ProximaMethods:
 
 
 class Serializers:
-    """Содержит функции для преобразования JSON ответа в нужные классы"""
+    """
+    Содержит функции для преобразования JSON ответа в нужные классы\n
+    update_time передаётся снаружи: один и тот же объект datetime на всю загрузку, а не время разбора каждой строки
+    """
     @staticmethod
-    def hospital_from_json(data):
+    def hospital_from_json(data, update_time=None):
         return Hospital(data["org_name"], data["org_id"], data["type_org_id"],
                         property_form=data["form_property_name"],
                         tax_code=data["code_tax"],
@@ -94,10 +189,10 @@ class Serializers:
                         phones="" if not data["get_phoneorg"]["result"] else
                         ";".join(p["phone"] for p in data["get_phoneorg"]["result"][:5]),
                         br_nick=data["br_nick"],
-                        update_time=datetime.datetime.now())
+                        update_time=update_time)
 
     @staticmethod
-    def address_from_json(data):
+    def address_from_json(data, update_time=None):
         return Address(uid=data["object_id"],
                        country=data["country"],
                        area=data["area"],
@@ -108,11 +203,11 @@ class Serializers:
                        house=data["house"],
                        flat=data["flat"],
                        city_id=data["city_id"],
-                       update_time=datetime.datetime.now(),
+                       update_time=update_time,
                        type_street=data["type_street"])
 
     @staticmethod
-    def job_from_json(data):
+    def job_from_json(data, update_time=None):
         return Job(data["post_id"],
                    data["person_id"],
                    data["object_id"],
@@ -120,26 +215,178 @@ class Serializers:
                    is_archive=data["is_archive"],
                    is_main=data["is_main"],
                    status=data["status"],
-                   update_time=datetime.datetime.now())
+                   update_time=update_time)
 
     @staticmethod
-    def person_from_json(data):
+    def person_from_json(data, update_time=None):
         return Person(data["firstname"], data["lastname"],
                       data["secondname"], data["person_id"],
                       status=data["status"],
                       is_archive=data["is_archive"],
                       sex=data["sex"],
-                      update_time=datetime.datetime.now())
+                      update_time=update_time)
 
     @staticmethod
-    def spec_from_json(data):
+    def spec_from_json(data, update_time=None):
         return Spec(data["name_rus"], data["object_id"], category=data["category"],
-                    is_main=data["is_main"], update_time=datetime.datetime.now())
+                    is_main=data["is_main"], update_time=update_time)
+
+    @staticmethod
+    def post_from_json(data, update_time=None):
+        return Post(data["name_rus"], data["type_name"], data["object_id"], update_time=update_time)
+
+    @staticmethod
+    def type_from_json(data, update_time=None):
+        return HospitalType(data["name"], data["object_id"], data["parent_id"], update_time=update_time)
+
+    # Кортежи значений в порядке FIELDS моделей для Batch. Повторяющиеся строки (статусы, города, имена)
+    # интернируются, чтобы пакет хранил ссылки на одну строку, а не тысячи её копий
+
+    @staticmethod
+    def hospital_row(data, update_time):
+        phones = data["get_phoneorg"]["result"]
+        return (int(data["org_id"]), update_time, data["org_name"], int(data["type_org_id"]),
+                _intern(data["form_property_name"]), _intern(data["status"]), int(data["is_archive"]),
+                data["code_tax"], data["corp_id"], data["center_id"], data["br_nick"],
+                "" if not phones else ";".join(p["phone"] for p in phones[:5]))
+
+    @staticmethod
+    def address_row(data, update_time):
+        return (data["object_id"], update_time, _intern(data["country"]), _intern(data["area"]),
+                _intern(data["region"]), _intern(data["city"]), _intern(data["street"]), data["building"],
+                data["house"], data["flat"], None, data["city_id"], _intern(data["type_street"]))
+
+    @staticmethod
+    def job_row(data, update_time):
+        return (data["object_id"], update_time, data["person_id"], data["is_main"], data["is_archive"],
+                data["post_id"], _intern(data["status"]), data["org_id"])
+
+    @staticmethod
+    def person_row(data, update_time):
+        return (data["person_id"], update_time, _intern(data["firstname"]), _intern(data["lastname"]),
+                _intern(data["secondname"]), _intern(data["status"]), data["is_archive"], data["sex"])
+
+    @staticmethod
+    def spec_row(data, update_time):
+        return data["object_id"], update_time, _intern(data["name_rus"]), data["category"], data["is_main"]
+
+    @staticmethod
+    def post_row(data, update_time):
+        return data["object_id"], update_time, data["name_rus"], _intern(data["type_name"])
+
+    @staticmethod
+    def type_row(data, update_time):
+        return data["object_id"], update_time, data["name"], data["parent_id"]
+
+
+@lru_cache(maxsize=4096)
+def from_timestamp(timestamp):
+    """datetime из last_update, у записей одной загрузки повторяющийся last_update разбирается один раз"""
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+def _intern(value):
+    return intern(value) if type(value) is str else value
+
+
+class Parsers:
+    """
+    Разбирают строки одной страницы ответа (ResponsePayload.result) на пакеты Batch для callback\n
+    update_time - время загрузки, общее для всех записей, по умолчанию время разбора страницы.
+    Недавние записи получают время из своего last_update
+    """
+
+    @staticmethod
+    def recent_hospitals(result, update_time=None):
+        hosp, addr = Batch(Hospital), Batch(Address)
+        for row in result:
+            if row['get_orgs']['fetch'] == 0 or row["get_orgs"]["result"][0]["get_address"]["fetch"] == 0:
+                logger.warning(f"Received empty data: {row}")
+                continue
+            obj = row["get_orgs"]["result"]
+            last_update = from_timestamp(row["last_update"])
+
+            hosp.append(Serializers.hospital_row(obj[0], last_update))
+            addr.append(Serializers.address_row(obj[0]["get_address"]["result"][0], last_update))
+        return hosp, addr
+
+    @staticmethod
+    def hospitals(result, update_time=None):
+        if update_time is None: update_time = datetime.datetime.now()
+        hosp, addr = Batch(Hospital), Batch(Address)
+        for row in result:
+            if row["get_address"]["fetch"] == 0:
+                logger.warning(f"Received empty data: {row}")
+                continue
+
+            hosp.append(Serializers.hospital_row(row, update_time))
+            addr.append(Serializers.address_row(row["get_address"]["result"][0], update_time))
+        return hosp, addr
+
+    @staticmethod
+    def recent_persons(result, update_time=None):
+        pers, specs, jobs = Batch(Person), Batch(Spec), Batch(Job)
+        for row in result:
+            obj = row["get_persons"]["result"]
+            last_update = from_timestamp(row["last_update"])
+            pers.append(Serializers.person_row(obj[0], last_update))
+
+            if obj[0]["get_spec"]["fetch"] != 0:
+                for s in obj[0]["get_spec"]["result"]:
+                    specs.append(Serializers.spec_row(s, last_update))
+
+            if obj[0]["get_job"]["fetch"] != 0:
+                for j in obj[0]["get_job"]["result"]:
+                    jobs.append(Serializers.job_row(j, last_update))
+        return pers, specs, jobs
+
+    @staticmethod
+    def persons(result, update_time=None):
+        if update_time is None: update_time = datetime.datetime.now()
+        pers, specs, jobs = Batch(Person), Batch(Spec), Batch(Job)
+        for row in result:
+            pers.append(Serializers.person_row(row, update_time))
+
+            if row["get_spec"]["fetch"] != 0:
+                for s in row["get_spec"]["result"]:
+                    specs.append(Serializers.spec_row(s, update_time))
+
+            if row["get_job"]["fetch"] != 0:
+                for j in row["get_job"]["result"]:
+                    jobs.append(Serializers.job_row(j, update_time))
+        return pers, specs, jobs
+
+    @staticmethod
+    def recent_jobs(result, update_time=None):
+        jobs = Batch(Job)
+        for row in result:
+            if row['get_job']['fetch'] == 0:
+                logger.warning(f"Received empty data: {row}")
+                continue
+            obj = row["get_job"]["result"]
+            jobs.append(Serializers.job_row(obj[0], from_timestamp(row["last_update"])))
+        return jobs,
+
+    @staticmethod
+    def jobs(result, update_time=None):
+        if update_time is None: update_time = datetime.datetime.now()
+        jobs = Batch(Job)
+        for row in result:
+            jobs.append(Serializers.job_row(row, update_time))
+        return jobs,
 
     @staticmethod
-    def post_from_json(data):
-        return Post(data["name_rus"], data["type_name"], data["object_id"], update_time=datetime.datetime.now())
+    def posts(result, update_time=None):
+        if update_time is None: update_time = datetime.datetime.now()
+        posts = Batch(Post)
+        for row in result:
+            posts.append(Serializers.post_row(row, update_time))
+        return posts,
 
     @staticmethod
-    def type_from_json(data):
-        return HospitalType(data["name"], data["object_id"], data["parent_id"], update_time=datetime.datetime.now())
+    def types(result, update_time=None):
+        if update_time is None: update_time = datetime.datetime.now()
+        types = Batch(HospitalType)
+        for row in result:
+            types.append(Serializers.type_row(row, update_time))
+        return types,
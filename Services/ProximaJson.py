@@ -0,0 +1,92 @@
+"""
+Разбор JSON ответов API\n
+Использует orjson, если он установлен, иначе стандартный json. Потоковый разбор страниц требует ijson
+"""
+import json
+
+from Services.ProximaHelpers import CriticalException, WaitingException
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+
+def loads(data):
+    """Разбирает тело ответа (bytes или str) самым быстрым доступным парсером"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Сериализует obj в компактную строку JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def can_stream():
+    return ijson is not None
+
+
+def iter_page(stream, method):
+    """
+    Потоковый разбор страницы ответа вида {method: {"fetch": ..., "more": ..., "result": [...]}}\n
+    Строки result выдаются по мере чтения из stream, не дожидаясь загрузки всего ответа.
+    Если fetch и more идут в ответе после result, страница читается целиком
+    :param stream: файлоподобный объект с телом ответа, например requests.Response.raw
+    :param method: тип запроса из ProximaHelpers.ProximaMethods
+    :return: словарь {"fetch": int, "more": bool, "result": итератор строк}
+    :raise WaitingException: сервер ещё готовит данные, как в ProximaHelpers.check_status
+    """
+    events = ijson.parse(stream, use_float=True)
+    page = {"fetch": None, "more": None, "result": []}
+    result = f"{method}.result"
+
+    info = {}
+    for prefix, event, value in events:
+        if prefix == f"{method}.fetch": page["fetch"] = value
+        elif prefix == f"{method}.more": page["more"] = value
+        elif prefix == result and event == "start_array": break
+        elif prefix in ("resultcode", "errormessage"): info[prefix] = value
+        elif prefix == "getwait.result.item.status": info["status"] = value
+        elif prefix == "getwait.result.item.object_id": info["object_id"] = value
+    else:
+        if info.get("status") == "IN_PROGRESS":
+            raise WaitingException("Data is not ready.", info.get("object_id"))
+        if info.get("resultcode") == 400:
+            raise CriticalException(f"API error: {info.get('errormessage')}.", 400)
+        raise Exception(f"Cannot get information. [{info.get('resultcode')}] {info.get('errormessage')}.")
+
+    rows = _rows(events, method, page)
+    page["result"] = list(rows) if page["fetch"] is None or page["more"] is None else rows
+    return page
+
+
+def _rows(events, method, page):
+    item = f"{method}.result.item"
+    for prefix, event, value in events:
+        if prefix == item and event in ("start_map", "start_array"):
+            builder, depth = ObjectBuilder(), 1
+            while depth:
+                builder.event(event, value)
+                prefix, event, value = next(events)
+                if event in ("start_map", "start_array"): depth += 1
+                elif event in ("end_map", "end_array"): depth -= 1
+            yield builder.value
+        elif prefix == item:
+            yield value
+        elif prefix == f"{method}.result" and event == "end_array":
+            break
+
+    # дочитываем ответ: fetch и more могут идти после result, соединение вернётся в пул только после чтения
+    for prefix, event, value in events:
+        if prefix == f"{method}.fetch": page["fetch"] = value
+        elif prefix == f"{method}.more": page["more"] = value
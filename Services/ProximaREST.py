@@ -1,143 +1,279 @@
 """Предоставляет доступ к функционалу API"""
+import datetime
 import json
 import threading
 import time
+from functools import partial
 import concurrent
 from concurrent.futures import ThreadPoolExecutor
 import requests as req
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
 
 from Settings.Logger import *
 from Services.ProximaHelpers import *
 import Services.ProximaTemplates as Templates
+import Services.ProximaJson as ProximaJson
+from Services.Pipeline import Pipeline
+from Services.Poller import AwaitingPoller, ReadinessModel
+from Services.Concurrency import AimdController
+from Services.Retry import RetryPolicy
+from Services.ParsePool import ParsePool
+
+
+# разрывы соединения и таймауты: при чтении r.raw в потоковом режиме urllib3 не оборачивается в исключения requests
+NETWORK_ERRORS = (req.Timeout, req.ConnectionError, ProtocolError, ReadTimeoutError)
 
 
 class ProximaREST:
     """Предоставляет доступ к функционалу API"""
 
     def __init__(self, url, key, sign, proxy=None, wait_time=120, retries=0,
-                 timeout=10, threads=8):
+                 timeout=10, threads=8, pool_size=None, writers=1, queue_size=16, min_wait_time=5,
+                 min_threads=1, retry=None, checkpoint=None, resume=False, archive=None,
+                 decoder=None, stream=False, on_page=None, page_size=1000, parse_workers=0,
+                 coalesce=0, linger=5.0):
+        """
+        :param coalesce: сколько записей каждой таблицы Pipeline копит из нескольких страниц перед вызовом callback,
+            0 - callback на каждую страницу
+        :param linger: сколько секунд страница может ждать в буфере Pipeline, пока не набралось coalesce записей
+        :param parse_workers: число процессов ParsePool для разбора страниц, 0 - разбор в потоках загрузки.
+            Не используется вместе с archive, отключает stream
+        :param page_size: число записей в одном запросе, не больше 1000
+        :param on_page: функция вида f(method, skip, seconds), вызывается при получении каждой страницы
+            с временем от первой отправки запроса, включая повторы и ожидание подготовки данных
+        :param decoder: функция вида f(bytes) -> dict для разбора ответов, по умолчанию ProximaJson.loads
+        :param stream: True, чтобы разбирать строки страницы по мере получения ответа (нужен ijson). Ответ
+            всё равно дочитывается внутри запроса, поэтому обрыв соединения посреди тела повторяется по self.retry
+        :param archive: ResponseArchive, в который записывается каждая полученная страница
+        :param checkpoint: CheckpointStore, в котором отмечаются записанные страницы
+        :param resume: True, чтобы пропускать страницы, записанные прошлым незавершённым запуском
+        :param retries: число повторов каждого запроса после ошибки
+        :param timeout: таймаут первой попытки запроса, следующие попытки получают больше времени
+        :param retry: RetryPolicy, заменяет retries и timeout
+        :param threads: максимальное число одновременных запросов, фактическое подбирает AimdController
+        :param min_threads: число одновременных запросов, ниже которого AimdController не опускается
+        :param wait_time: максимальный интервал между опросами данных, которые сервер ещё готовит
+        :param min_wait_time: интервал до первого опроса, пока время подготовки данных сервером неизвестно
+        :param pool_size: число keep-alive соединений в пуле HTTP сессии, по умолчанию равно threads
+        :param writers: число потоков, параллельно вызывающих callback при многопоточной загрузке
+        :param queue_size: сколько загруженных страниц может ждать записи, прежде чем загрузка приостановится
+        """
         self.url = url
         self.key = key
         self.sign = sign
-        self.header = {'Token': str(self.key), 'sign': str(self.sign), 'Content-Type': 'application/json'}
-        self.awaiting = None
+        self.header = {'Token': str(self.key), 'sign': str(self.sign), 'Content-Type': 'application/json',
+                       'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
         self.wait_time = wait_time
         self.proxy = proxy
-        self.max_retries = retries
-        self.timeout = timeout
-        self.__parallel = True
-        self.__retries = 0
+        self.retry = retry if retry is not None else RetryPolicy(retries, timeout)
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.archive = archive
+        self.decoder = decoder if decoder is not None else ProximaJson.loads
+        self.parse_pool = ParsePool(parse_workers, self.decoder) if parse_workers and archive is None else None
+        if parse_workers and self.parse_pool is None: logger.warning("Parsing in processes is disabled.")
+        self.stream = stream and ProximaJson.can_stream() and archive is None and self.parse_pool is None
+        self.on_page = on_page
+        if stream and not self.stream: logger.warning("Streaming JSON parsing is disabled.")
         self.threads = threads
-        self.__step = 1000  # Proxima не выдаёт более 1000 записей за один запрос
+        self.__step = min(page_size, 1000)  # Proxima не выдаёт более 1000 записей за один запрос
+        self.pool_size = pool_size if pool_size is not None else threads
+        self.writers = writers
+        self.queue_size = queue_size
+        self.coalesce = coalesce
+        self.linger = linger
+        self.failed = False  # True, если последняя загрузка get_* не получила или не записала какие-то страницы
+        self.__session = self.__make_session()
+        self.concurrency = AimdController(threads, min_threads)
+        self.__poller = AwaitingPoller(self.__poll, ReadinessModel(min_wait_time, wait_time),
+                                       retry=self.retry, capacity=self.threads * 8, workers=self.threads)
+
+    def __make_session(self):
+        """Одна сессия на все потоки, соединения переиспользуются вместо нового TCP+TLS на каждую страницу"""
+        session = req.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.header)
+        return session
+
+    def close(self):
+        """Закрывает все соединения пула, потоки опроса и процессы ParsePool"""
+        self.__poller.close()
+        self.__session.close()
+        if self.parse_pool is not None: self.parse_pool.close()
 
     @staticmethod
     def __success_msg(is_more, *data):
         return f"{'All data is gathered, r' if not is_more else 'R'}eceived " \
                f"{list(map(len, data))} items{', more available' if is_more else ''}."
 
-    def __waiting_msg(self):
-        return f"Data is not ready, waiting " \
-               f"{f'{self.wait_time // 60}m ' if self.wait_time // 60 != 0 else ''}{self.wait_time % 60}s."
-
-    def __retry(self, sleep=10, timeout_buff=0):
-        time.sleep(sleep)
-        self.__retries += 1
-        self.timeout += timeout_buff
-        return f"Trying to connect again. {self.max_retries - self.__retries} retries left."
-
-    def __check_status(self, response, expected_item):
-        info = response.json()
-
-        if response.status_code == 201 and 'status' in info and info['status'] == 'IN_PROGRESS':
-            self.awaiting = info["object_id"]
-            raise WaitingException("Data is not ready.")
-
-        if response.status_code != 200:
-            raise CriticalException(f"Cannot get information. HTTP code {response.status_code}.")
-        else:
-            if 'getwait' in info and info['getwait']['result'][0]['status'] == 'IN_PROGRESS':
-                self.awaiting = info['getwait']['result'][0]["object_id"]
-                raise WaitingException("Data is not ready.")
-
-            self.awaiting = None
-
-            if 'resultcode' in info and info['resultcode'] == 400:
-                raise Exception(f"API error: {info['errormessage']}.")
-
-            if expected_item is not None and expected_item not in info:
-                self.awaiting = None
-                raise Exception(f"Cannot get information. [{info['resultcode']}] {info['errormessage']}.")
-
-    def __send_request(self, template, method):
+    def __send_request(self, template, method, parser=None):
         """
+        Отправляет запрос, повторяя его по правилам self.retry\n
         :param template: шаблон запроса из ProximaTemplates
         :param method: тип запроса из ProximaHelpers.ProximaMethods
+        :param parser: если задан ParsePool, страница разбирается в нём и пакеты возвращаются в items
+        :return: ResponsePayload, со статусом WAITING и object_id, если сервер ещё готовит данные
         """
-        try:
-            if self.awaiting is None:
-                r = req.post(self.url, data=template, headers=self.header, proxies=self.proxy, timeout=self.timeout)
-                self.__check_status(r, method)
-                data = r.json()[method]
-            else:
-                r = req.post(self.url,
-                             data=Templates.awaited(self.awaiting),
-                             headers=self.header,
-                             proxies=self.proxy,
-                             timeout=self.timeout)
-                self.__check_status(r, None)
-                data = r.json()[ProximaMethods.awaited()]["result"][0]["recordset"][method]
-        except WaitingException:
-            logger.debug(self.__waiting_msg())
-            time.sleep(self.wait_time)
-            return ResponsePayload(ProcessingStatus.WAITING)
-        except CriticalException as e:
-            logger.error(e)
-            return ResponsePayload(ProcessingStatus.ERROR)
-        except Exception as e:
-            logger.error(e)
-            if self.__retries >= self.max_retries:
+        attempt = 0
+        while True:
+            started, ok, latency = self.concurrency.acquire(), True, None
+            try:
+                r = self.__session.post(self.url, data=template, proxies=self.proxy,
+                                        timeout=self.retry.timeout(attempt), stream=self.stream)
+                elapsed = time.monotonic() - started  # AimdController учитывает только страницы данных
+                if self.stream and r.status_code == 200:
+                    r.raw.decode_content = True
+                    r.raw.enforce_content_length = True  # обрыв тела - ProtocolError, а не неполный JSON
+                    page = ProximaJson.iter_page(r.raw, method)
+                    # строки разбираются по мере получения, но до выхода из запроса, пока занят слот AimdController
+                    page["result"] = list(page["result"])
+                    latency = time.monotonic() - started
+                    return ResponsePayload(ProcessingStatus.OK, page)
+                if self.parse_pool is not None and parser is not None and r.status_code == 200:
+                    payload = self.parse_pool.parse(r.content, method, parser)
+                    latency = elapsed
+                    return payload
+                info = self.decoder(r.content)
+                check_status(r.status_code, info, method)
+                latency = elapsed
+                return ResponsePayload(ProcessingStatus.OK, info[method])
+            except WaitingException as e:
+                return ResponsePayload(ProcessingStatus.WAITING, object_id=e.object_id)
+            except Exception as e:
+                if isinstance(e, CriticalException): ok = not ProximaREST.__congested(e.status_code)
+                else: ok = not isinstance(e, NETWORK_ERRORS)
+                error = e
+            finally:
+                self.concurrency.release(started, ok, latency)
+
+            if not self.retry.should_retry(error, attempt):
+                logger.error(error)
                 return ResponsePayload(ProcessingStatus.ERROR)
-            else:
-                logger.warning(self.__retry(timeout_buff=30))
-                return ResponsePayload(ProcessingStatus.RETRY)
-
-        self.__retries = 0
-        return ResponsePayload(ProcessingStatus.OK, data)
-
-    def __do_parallel(self, func, callback, skip, nmax, update=0):
-        if nmax is None: step = int(15/self.threads + 1)*1000  # потоки будут выдавать от 1к до 8к элементов каждый
-        else: step = round(nmax / self.threads)
-        is_more = True
-        self.__parallel = False
+            delay = self.retry.delay(attempt)
+            attempt += 1
+            logger.warning(f"{error} Trying to connect again in {delay:.0f}s. "
+                           f"{self.retry.retries - attempt} retries left.")
+            time.sleep(delay)
 
-        while is_more:
-            data = [[]]  # костыль, если убрать внешний цикл, будет вылетать во вложенной функции
-
-            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="proxima") as executor:
-                def save(*items):
-                    if not data[0]:
-                        for i in items: data[0].append(i)
-                    else:
-                        for d, i in zip(data[0], items): d += i
+    def __poll(self, object_id, method, attempt=0):
+        """
+        Запрашивает данные, которые сервер готовил, вызывает WaitingException, если они ещё не готовы\n
+        Задержка опросов не передаётся AimdController: большинство из них - быстрые ответы IN_PROGRESS
+        """
+        started, ok = self.concurrency.acquire(), True
+        try:
+            r = self.__session.post(self.url, data=Templates.awaited(object_id), proxies=self.proxy,
+                                    timeout=self.retry.timeout(attempt))
+            ok = not ProximaREST.__congested(r.status_code)
+            info = self.decoder(r.content)
+            check_status(r.status_code, info, None)
+            return info[ProximaMethods.awaited()]["result"][0]["recordset"][method]
+        except NETWORK_ERRORS:
+            ok = False
+            raise
+        finally:
+            self.concurrency.release(started, ok)
 
-                future_to_request = {
-                    executor.submit(func, save, skip + i*step, step, update): i for i in range(self.threads)
-                }
-                for future in concurrent.futures.as_completed(future_to_request):
-                    is_more = is_more and future.result()
+    @staticmethod
+    def __congested(status_code):
+        """True для HTTP кодов перегрузки сервера: 5xx и повторяемых 4xx из RetryPolicy (408, 425, 429)"""
+        return status_code is not None and (status_code >= 500 or status_code in RetryPolicy.RETRYABLE_CODES)
 
-            logger.debug(f"Saving.")
-            callback(*data[0])
+    @staticmethod
+    def __entity(method, update):
+        return method if update is None else f"{method}:{update}"
 
-            if not is_more or nmax is not None: break
+    def __work(self, cursor, template, method, parser, pipeline, update):
+        """
+        Поток загрузки: берёт у cursor следующую страницу, пока они не закончатся\n
+        Страницы, которые сервер ещё готовит, передаются AwaitingPoller, загрузка продолжается со следующей.
+        Дождавшиеся страницы разбираются потоками AwaitingPoller, без ParsePool. Если такую страницу
+        не удалось получить или записать в Pipeline, cursor останавливается, как после ошибки запроса
+        """
+        def save(offset, payload, started):
+            if self.on_page is not None: self.on_page(method, offset, time.monotonic() - started)
+            if payload.status == ProcessingStatus.EMPTY or not payload.is_more: cursor.finish(offset)
+            if payload.status == ProcessingStatus.EMPTY: return
+            if self.archive is not None: self.archive.record(method, offset, payload, update)
+            items = payload.items if payload.items is not None else parser(payload.result)
+            pipeline.put(*items, done=None if self.checkpoint is None else
+                         lambda: self.checkpoint.mark(ProximaREST.__entity(method, update), offset))
+            logger.debug(ProximaREST.__success_msg(payload.is_more, *items))
 
-        self.__parallel = True
-        return is_more
+        try:
+            offset = cursor.next()
+            while offset is not None:
+                started = time.monotonic()
+                payload = self.__send_request(template(offset, self.__step), method, parser)
+                if payload.status == ProcessingStatus.WAITING:
+                    self.__poller.submit(payload.object_id, method,
+                                         lambda data, o=offset, t=started:
+                                         save(o, ResponsePayload(ProcessingStatus.OK, data), t),
+                                         lambda error: cursor.fail())
+                elif payload.status == ProcessingStatus.ERROR:
+                    cursor.fail()
+                else:
+                    save(offset, payload, started)
+                offset = cursor.next()
+        except BaseException:
+            cursor.fail()  # остальные потоки не берут новые страницы, ошибка передаётся в __fetch
+            raise
+
+    def __fetch(self, template, method, parser, callback, skip, nmax, update=None, parallel=True):
+        """
+        Загружает страницы одного метода API\n
+        Несколько потоков загрузки берут страницы из общего PageCursor, поэтому медленная страница задерживает
+        только свой поток, а загруженные страницы сразу передаются на запись через Pipeline
+        :param template: функция вида f(skip, first) -> str, строящая запрос из ProximaTemplates
+        :param method: тип запроса из ProximaHelpers.ProximaMethods
+        :param parser: функция из ProximaHelpers.Parsers, превращающая страницу в списки объектов для callback
+        :param update: время последнего обновления для недавних записей, отличает прогресс в CheckpointStore
+        :param parallel: False, чтобы загружать в одном потоке
+        :return: True, если остались незагруженные данные, False, если загруженны все данные
+        """
+        logger.info("Requesting data.")
+        entity = ProximaREST.__entity(method, update)
+        done = set()
+        if self.checkpoint is not None:
+            if self.resume: done = self.checkpoint.done(entity)
+            else: self.checkpoint.reset(entity)
+            if done: logger.info(f"Resuming, {len(done)} pages are already saved.")
+
+        cursor = PageCursor(skip, self.__step, nmax, done)
+        parser = partial(parser, update_time=datetime.datetime.now())  # одно время загрузки для всех записей
+        threads = self.threads if parallel and (nmax is None or nmax > 4000) else 1
+
+        with Pipeline(callback if callback else lambda *items: None, self.queue_size, self.writers,
+                      self.coalesce, self.linger) as pipeline:
+            try:
+                if threads == 1:
+                    self.__work(cursor, template, method, parser, pipeline, update)
+                else:
+                    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="proxima") as executor:
+                        futures = [executor.submit(self.__work, cursor, template, method, parser, pipeline, update)
+                                   for _ in range(threads)]
+                        try:
+                            for future in concurrent.futures.as_completed(futures):
+                                future.result()
+                        except BaseException:
+                            cursor.fail()  # например, KeyboardInterrupt, пока главный поток ждёт потоки загрузки
+                            raise
+            finally:
+                self.__poller.join()  # ожидаемые страницы записываются до остановки Pipeline
+
+        self.failed = cursor.failed or pipeline.errors != 0
+        if self.checkpoint is not None and not self.failed:
+            self.checkpoint.reset(entity)
+        if threads > 1: logger.debug(f"Concurrency limit {self.concurrency.limit}/{self.threads}.")
+        return cursor.is_more
 
     def get_recent_hospitals(self, callback, skip=0, nmax=None, update=0):
         """
         Список всех недавно обновлённых учреждений и их адресов\n
-        Может работать в нескольких потоках, при nmax > 4000 и is_parallel\n
+        Может работать в нескольких потоках, при nmax > 4000\n
         :param callback: функция вида f(list[Hospital], list[Address]) -> None, которая будет вызываться для
             обработки/сохранения данных после каждого запроса
         :param skip: пропускает первые записи
@@ -145,47 +281,13 @@ class ProximaREST:
         :param update: время в формате timestamp последнего обновления записей
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-
-        if self.__parallel and self.threads > 1 and (nmax is None or nmax > 4000):
-            logger.info("Requesting data.")
-            return self.__do_parallel(self.get_recent_hospitals, callback, skip, nmax, update)
-        elif self.threads == 1: logger.info("Requesting data.")
-        else: logger.debug("Requesting data.")
-
-        if nmax is not None: nmax += skip
-        is_more = True
-        count = [0, 0]
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            hosp, addr = [], []
-            payload = self.__send_request(Templates.recent_hospitals(skip, self.__step, update),
-                                          ProximaMethods.hospitals(True))
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                if row['get_orgs']['fetch'] == 0 or row["get_orgs"]["result"][0]["get_address"]["fetch"] == 0:
-                    logger.warning(f"Received empty data: {row}")
-                    continue
-                obj = row["get_orgs"]["result"]
-
-                hosp.append(Serializers.hospital_from_json(obj[0]))
-                hosp[-1].update_time = datetime.datetime.fromtimestamp(row["last_update"])
-                addr.append(Serializers.address_from_json(obj[0]["get_address"]["result"][0]))
-                addr[-1].update_time = hosp[-1].update_time
-
-            count = count[0] + len(hosp), count[1] + len(addr)
-            if callback: callback(hosp, addr)
-            logger.debug(ProximaREST.__success_msg(is_more, hosp, addr))
-        return is_more
+        return self.__fetch(lambda s, n: Templates.recent_hospitals(s, n, update), ProximaMethods.hospitals(True),
+                            Parsers.recent_hospitals, callback, skip, nmax, update)
 
     def get_hospitals(self, callback, skip=0, nmax=None, update=None):
         """
         Список всех учреждений и их адресов\n
-        Может работать в нескольких потоках, при nmax > 4000 и is_parallel\n
+        Может работать в нескольких потоках, при nmax > 4000\n
         :param callback: функция вида f(list[Hospital], list[Address]) -> None, которая будет вызываться для
             обработки/сохранения данных после каждого запроса
         :param skip: пропускает первые записи
@@ -193,45 +295,12 @@ class ProximaREST:
         :param update: не используется, нужен для совместимости с функцией многопоточности
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if self.__parallel and self.threads > 1 and (nmax is None or nmax > 4000):
-            logger.info("Requesting data.")
-            return self.__do_parallel(self.get_hospitals, callback, skip, nmax, update)
-        elif self.threads == 1: logger.info("Requesting data.")
-        else: logger.debug("Requesting data.")
-
-        if nmax is not None: nmax += skip
-        is_more = True
-        count = [0, 0]
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            hosp, addr = [], []
-
-            payload = self.__send_request(Templates.hospitals(skip, self.__step), ProximaMethods.hospitals())
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                if row["get_address"]["fetch"] == 0:
-                    logger.warning(f"Received empty data: {row}")
-                    continue
-
-                hosp.append(Serializers.hospital_from_json(row))
-                hosp[-1].update_time = datetime.datetime.now()
-                addr.append(Serializers.address_from_json(row["get_address"]["result"][0]))
-                addr[-1].update_time = datetime.datetime.now()
-
-            count = count[0] + len(hosp), count[1] + len(addr)
-            if callback: callback(hosp, addr)
-            logger.debug(ProximaREST.__success_msg(is_more, hosp, addr))
-        return is_more
+        return self.__fetch(Templates.hospitals, ProximaMethods.hospitals(), Parsers.hospitals, callback, skip, nmax)
 
     def get_recent_persons(self, callback, skip=0, nmax=None, update=0):
         """
         Список всех людей и их специальностей, недавно обновлённых в базе данных\n
-        Может работать в нескольких потоках, при nmax > 4000 и is_parallel\n
+        Может работать в нескольких потоках, при nmax > 4000\n
         :param callback: функция вида f(list[Person], list[Spec], list[Job]) -> None, которая будет вызываться для
             обработки/сохранения данных после каждого запроса
         :param skip: пропускает первые записи
@@ -239,52 +308,13 @@ class ProximaREST:
         :param update: время в формате timestamp последнего обновления записей
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if self.__parallel and self.threads > 1 and (nmax is None or nmax > 4000):
-            logger.info("Requesting data.")
-            return self.__do_parallel(self.get_recent_persons, callback, skip, nmax, update)
-        elif self.threads == 1: logger.info("Requesting data.")
-        else: logger.debug("Requesting data.")
-
-        is_more = True
-        if nmax is not None: nmax += skip
-        count = [0, 0, 0]
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            pers, specs, jobs = [], [], []
-
-            payload = self.__send_request(Templates.recent_persons(skip, self.__step, update),
-                                          ProximaMethods.persons(True))
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                obj = row["get_persons"]["result"]
-                pers.append(Serializers.person_from_json(obj[0]))
-                pers[-1].update_time = datetime.datetime.fromtimestamp(row["last_update"])
-
-                if row["get_persons"]["result"][0]["get_spec"]["fetch"] != 0:
-                    for s in obj[0]["get_spec"]["result"]:
-                        specs.append(Serializers.spec_from_json(s))
-                        specs[-1].update_time = pers[-1].update_time
-
-                if row["get_persons"]["result"][0]["get_job"]["fetch"] != 0:
-                    for j in obj[0]["get_job"]["result"]:
-                        jobs.append(Serializers.job_from_json(j))
-                        jobs[-1].update_time = pers[-1].update_time
-
-            count = count[0] + len(pers), count[1] + len(specs), count[2] + len(jobs)
-            if callback: callback(pers, specs, jobs)
-            logger.debug(ProximaREST.__success_msg(is_more, pers, specs, jobs))
-
-        return is_more
+        return self.__fetch(lambda s, n: Templates.recent_persons(s, n, update), ProximaMethods.persons(True),
+                            Parsers.recent_persons, callback, skip, nmax, update)
 
     def get_persons(self, callback, skip=0, nmax=None, update=None):
         """
         Список всех людей и их специальностей, недавно обновлённых в базе данных\n
-        Может работать в нескольких потоках, при nmax > 4000 и is_parallel\n
+        Может работать в нескольких потоках, при nmax > 4000\n
         :param callback: функция вида f(list[Person], list[Spec], list[Job]) -> None, которая будет вызываться для
             обработки/сохранения данных после каждого запроса
         :param skip: пропускает первые записи
@@ -292,50 +322,12 @@ class ProximaREST:
         :param update: не используется, нужен для совместимости с функцией многопоточности
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if self.__parallel and self.threads > 1 and (nmax is None or nmax > 4000):
-            logger.info("Requesting data.")
-            return self.__do_parallel(self.get_persons, callback, skip, nmax, update)
-        elif self.threads == 1: logger.info("Requesting data.")
-        else: logger.debug("Requesting data.")
-
-        is_more = True
-        if nmax is not None: nmax += skip
-        count = [0, 0, 0]
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            pers, specs, jobs = [], [], []
-
-            payload = self.__send_request(Templates.persons(skip, self.__step), ProximaMethods.persons())
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                pers.append(Serializers.person_from_json(row))
-                pers[-1].update_time = datetime.datetime.now()
-
-                if row["get_spec"]["fetch"] != 0:
-                    for s in row["get_spec"]["result"]:
-                        specs.append(Serializers.spec_from_json(s))
-                        specs[-1].update_time = datetime.datetime.now()
-
-                if row["get_job"]["fetch"] != 0:
-                    for j in row["get_job"]["result"]:
-                        jobs.append(Serializers.job_from_json(j))
-                        jobs[-1].update_time = datetime.datetime.now()
-
-            count = count[0] + len(pers), count[1] + len(specs), count[2] + len(jobs)
-            if callback: callback(pers, specs, jobs)
-            logger.debug(ProximaREST.__success_msg(is_more, pers, specs, jobs))
-
-        return is_more
+        return self.__fetch(Templates.persons, ProximaMethods.persons(), Parsers.persons, callback, skip, nmax)
 
     def get_recent_jobs(self, callback, skip=0, nmax=None, update=0):
         """
         Список всех мест работы из базы данных\n
-        Может работать в нескольких потоках, при nmax > 4000 и is_parallel\n
+        Может работать в нескольких потоках, при nmax > 4000\n
         :param callback: функция вида f(list[Job]) -> None, которая будет вызываться для
             обработки/сохранения данных после каждого запроса
         :param skip: пропускает первые записи
@@ -343,45 +335,13 @@ class ProximaREST:
         :param update: время в формате timestamp последнего обновления записей
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if self.__parallel and self.threads > 1 and (nmax is None or nmax > 4000):
-            logger.info("Requesting data.")
-            return self.__do_parallel(self.get_recent_jobs, callback, skip, nmax, update)
-        elif self.threads == 1: logger.info("Requesting data.")
-        else: logger.debug("Requesting data.")
-
-        is_more = True
-        if nmax is not None: nmax += skip
-        count = 0
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            jobs = []
-
-            payload = self.__send_request(Templates.recent_jobs(skip, self.__step, update), ProximaMethods.jobs(True))
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                if row['get_job']['fetch'] == 0:
-                    logger.warning(f"Received empty data: {row}")
-                    continue
-                obj = row["get_job"]["result"]
-                j = Serializers.job_from_json(obj[0])
-                j.update_time = datetime.datetime.fromtimestamp(row["last_update"])
-                jobs.append(j)
-
-            count += len(jobs)
-            if callback: callback(jobs)
-            logger.debug(ProximaREST.__success_msg(is_more, jobs))
-
-        return is_more
+        return self.__fetch(lambda s, n: Templates.recent_jobs(s, n, update), ProximaMethods.jobs(True),
+                            Parsers.recent_jobs, callback, skip, nmax, update)
 
     def get_jobs(self, callback, skip=0, nmax=None, update=None):
         """
         Список всех мест работы из базы данных\n
-        Может работать в нескольких потоках, при nmax > 4000 и is_parallel\n
+        Может работать в нескольких потоках, при nmax > 4000\n
         :param callback: функция вида f(list[Job]) -> None, которая будет вызываться для
             обработки/сохранения данных после каждого запроса
         :param skip: пропускает первые записи
@@ -389,37 +349,7 @@ class ProximaREST:
         :param update: не используется, нужен для совместимости с функцией многопоточности
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if self.__parallel and self.threads > 1 and (nmax is None or nmax > 4000):
-            logger.info("Requesting data.")
-            return self.__do_parallel(self.get_jobs, callback, skip, nmax, update)
-        elif self.threads == 1: logger.info("Requesting data.")
-        else: logger.debug("Requesting data.")
-
-        is_more = True
-        if nmax is not None: nmax += skip
-        logger.info("Requesting data.")
-        count = 0
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            jobs = []
-
-            payload = self.__send_request(Templates.jobs(skip, self.__step), ProximaMethods.jobs())
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                j = Serializers.job_from_json(row)
-                j.update_time = datetime.datetime.now()
-                jobs.append(j)
-
-            count + len(jobs)
-            if callback: callback(jobs)
-            logger.debug(ProximaREST.__success_msg(is_more, jobs))
-
-        return is_more
+        return self.__fetch(Templates.jobs, ProximaMethods.jobs(), Parsers.jobs, callback, skip, nmax)
 
     def get_posts(self, callback, skip=0, nmax=None):
         """
@@ -430,30 +360,8 @@ class ProximaREST:
         :param nmax: ограничение на общее число записей (всегда >= ProximaREST.step). None чтобы загружать до конца.
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if nmax is not None: nmax += skip
-        is_more = True
-        logger.info("Requesting data.")
-        count = 0
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            posts = []
-
-            payload = self.__send_request(Templates.posts(skip, self.__step), ProximaMethods.posts())
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                posts.append(Serializers.post_from_json(row))
-                posts[-1].update_time = datetime.datetime.now()
-
-            count += len(posts)
-            if callback: callback(posts)
-            logger.debug(ProximaREST.__success_msg(is_more, posts))
-
-        return is_more
+        return self.__fetch(Templates.posts, ProximaMethods.posts(), Parsers.posts, callback, skip, nmax,
+                            parallel=False)
 
     def get_types(self, callback, skip=0, nmax=None):
         """
@@ -464,27 +372,5 @@ class ProximaREST:
         :param nmax: ограничение на общее число записей (всегда >= ProximaREST.step). None чтобы загружать до конца.
         :return: True, если остались незагруженные данные, False, если загруженны все данные
         """
-        if nmax is not None: nmax += skip
-        is_more = True
-        logger.info("Requesting data.")
-        count = 0
-
-        while is_more and (nmax is None or nmax is not None and skip < nmax):
-            types = []
-
-            payload = self.__send_request(Templates.types(skip, self.__step), ProximaMethods.types())
-            if payload.status == ProcessingStatus.ERROR or payload.status == ProcessingStatus.EMPTY: return is_more
-            elif payload.status != ProcessingStatus.OK: continue
-
-            is_more = payload.is_more
-            skip += payload.fetch
-
-            for row in payload.result:
-                types.append(Serializers.type_from_json(row))
-                types[-1].update_time = datetime.datetime.now()
-
-            count += len(types)
-            if callback: callback(types)
-            logger.debug(ProximaREST.__success_msg(is_more, types))
-
-        return is_more
+        return self.__fetch(Templates.types, ProximaMethods.types(), Parsers.types, callback, skip, nmax,
+                            parallel=False)
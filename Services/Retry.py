@@ -0,0 +1,48 @@
+"""Политика повторов запросов к API"""
+import random
+
+from Services.ProximaHelpers import CriticalException
+
+
+class RetryPolicy:
+    """
+    Повторы одного запроса: экспоненциальная задержка со случайным разбросом и свой таймаут на каждую попытку\n
+    Счётчик попыток ведёт вызывающий код для каждой страницы отдельно, политика не хранит состояния
+    """
+
+    RETRYABLE_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+    def __init__(self, retries=5, timeout=10, timeout_step=30, base_delay=1.0, max_delay=60.0):
+        """
+        :param retries: число повторов после первой попытки
+        :param timeout: таймаут первой попытки в секундах
+        :param timeout_step: на сколько секунд увеличивается таймаут каждой следующей попытки
+        :param base_delay: задержка перед первым повтором, удваивается с каждой попыткой
+        :param max_delay: максимальная задержка перед повтором
+        """
+        self.retries = retries
+        self.base_timeout = timeout
+        self.timeout_step = timeout_step
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def timeout(self, attempt):
+        """Таймаут попытки attempt (начиная с 0)"""
+        return self.base_timeout + attempt * self.timeout_step
+
+    def delay(self, attempt):
+        """Случайная задержка перед повтором после попытки attempt (full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def is_retryable(self, error):
+        """
+        Ответы API с HTTP кодом ошибки повторяются только для кодов из RETRYABLE_CODES,
+        разрывы соединения, таймауты и повреждённые ответы - всегда
+        """
+        if isinstance(error, CriticalException):
+            return error.status_code in RetryPolicy.RETRYABLE_CODES
+        return True
+
+    def should_retry(self, error, attempt):
+        """True, если после неудачной попытки attempt запрос нужно повторить"""
+        return attempt < self.retries and self.is_retryable(error)
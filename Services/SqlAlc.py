@@ -2,155 +2,438 @@
 Sql Alchemy
 """
 
-from sqlalchemy import create_engine, text
+import re
+import threading
+import time
+from functools import lru_cache
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from Settings.Logger import *
+from Models.BaseModel import Base
+from Models.Batch import Batch
+
+
+# столбцы таблиц, первым идёт ключ uid
+TABLES = {
+    "HospitalTypes": ("uid", "name", "parent_id", "update_time"),
+    "Addresses": ("uid", "country", "area", "region", "city", "city_id", "type_street", "street", "building",
+                  "house", "flat", "update_time"),
+    "Hospitals": ("uid", "name", "type_id", "property_form", "is_archive", "tax_code", "corp_id", "center_id",
+                  "phones", "br_nick", "status", "update_time"),
+    "Employee": ("uid", "firstname", "lastname", "secondname", "is_archive", "status", "sex", "update_time"),
+    "Jobs": ("uid", "person_id", "is_main", "is_archive", "post_id", "status", "org_id", "update_time"),
+    "Specialists": ("uid", "name", "category", "is_main", "update_time"),
+    "Posts": ("uid", "name", "type", "update_time"),
+}
+
+
+@lru_cache(maxsize=None)
+def positional(statement, paramstyle="qmark"):
+    """
+    Заменяет именованные параметры :name запроса на позиционные: ? для pyodbc и sqlite3, %s для psycopg2\n
+    :return: запрос и имена параметров в порядке их появления, по ним Base.getter строит кортежи значений
+    """
+    names = tuple(re.findall(r":(\w+)", statement))
+    return re.sub(r":\w+", "?" if paramstyle == "qmark" else "%s", statement), names
+
+
+def _merge(table, source, columns, lock):
+    """
+    MERGE из source (таблица или VALUES с именами столбцов) в table, существующие записи не более старыми\n
+    :param lock: табличная подсказка блокировок table, например SERIALIZABLE
+    """
+    names = ",".join(columns)
+    return (f"MERGE {table} WITH ({lock}) AS T USING {source} ON U.uid = T.uid "
+            f"WHEN MATCHED AND (T.update_time IS NULL OR U.update_time >= T.update_time) "
+            f"THEN UPDATE SET {','.join(f'T.{c}=U.{c}' for c in columns[1:])} "
+            f"WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({','.join('U.' + c for c in columns)});")
+
+
+def _on_conflict(table, columns):
+    """ON CONFLICT для SQLite и PostgreSQL, существующие записи заменяются не более старыми"""
+    return (f"ON CONFLICT (uid) DO UPDATE SET {','.join(f'{c}=excluded.{c}' for c in columns[1:])} "
+            f"WHERE {table}.update_time IS NULL OR excluded.update_time >= {table}.update_time")
+
+
+@lru_cache(maxsize=None)
+def row_upsert(dialect, table, columns, lock="SERIALIZABLE"):
+    """
+    Запрос обновления одной записи с параметрами :name, для SqlAlc(bulk=False)\n
+    :param dialect: SqlAlc.dialect
+    :param columns: столбцы таблицы из TABLES, первым идёт ключ uid
+    :param lock: подсказка блокировок для MERGE в MS SQL
+    """
+    names, values = ",".join(columns), ",".join(":" + c for c in columns)
+    if dialect == "mssql":
+        return _merge(table, f"(VALUES ({values})) AS U ({names})", columns, lock)
+    return f"INSERT INTO {table} ({names}) VALUES ({values}) {_on_conflict(table, columns)}"
+
+
+@lru_cache(maxsize=None)
+def staged_upsert(dialect, table, columns, lock="SERIALIZABLE"):
+    """
+    Запросы пакетного обновления table через временную таблицу\n
+    Пакет одним executemany вставляется во временную таблицу, затем один запрос переносит его в table:
+    MERGE для MS SQL, INSERT ... ON CONFLICT для SQLite и PostgreSQL. Вместо обращения к серверу на каждую
+    строку получается четыре на пакет. rowcount переноса - число вставленных и обновлённых записей,
+    а запрос matched считает записи пакета, которые уже есть в table, по индексу uid, без просмотра таблицы
+    :param dialect: SqlAlc.dialect
+    :param columns: столбцы таблицы из TABLES, первым идёт ключ uid
+    :param lock: подсказка блокировок для MERGE в MS SQL. SERIALIZABLE защищает от вставки того же uid другим
+        сеансом, но блокирует диапазоны ключей. Если записи сеансов не пересекаются по uid (PartitionedWriter),
+        достаточно ROWLOCK
+    :return: запросы подготовки временной таблицы, INSERT в неё с параметрами :name, запрос matched,
+        запрос переноса, запросы очистки
+    """
+    names = ",".join(columns)
+    if dialect == "mssql":
+        stage = f"#stage_{table}"
+        prepare = (f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}; "
+                   f"SELECT TOP 0 {names} INTO {stage} FROM {table}",)
+        apply = _merge(table, f"{stage} AS U", columns, lock)
+        cleanup = (f"DROP TABLE {stage}",)
+    else:
+        stage = f"stage_{table}"
+        prepare = (f"CREATE TEMP TABLE IF NOT EXISTS {stage} AS SELECT {names} FROM {table} "
+                   f"{'WHERE 0' if dialect == 'sqlite' else 'WITH NO DATA'}",)
+        # WHERE true нужен SQLite, чтобы ON CONFLICT не был принят за часть SELECT
+        apply = (f"INSERT INTO {table} ({names}) SELECT {names} FROM {stage} WHERE true "
+                 f"{_on_conflict(table, columns)}")
+        cleanup = (f"DELETE FROM {stage}",)
+    insert = f"INSERT INTO {stage} ({names}) VALUES ({','.join(':' + c for c in columns)})"
+    matched = f"SELECT count(*) FROM {stage} S JOIN {table} T ON T.uid = S.uid"
+    return prepare, insert, matched, apply, cleanup
+
+
+def shadow_load(dialect, table, columns, stamp):
+    """
+    Запросы полной загрузки table через теневую таблицу {table}_load\n
+    Теневая таблица создаётся без ключей и индексов и заполняется простым INSERT. В конце из повторов uid
+    остаётся самая поздняя запись, при равном update_time - вставленная последней, ключ uid строится один раз,
+    и таблицы меняются местами переименованием. Кроме столбцов и ключа uid ничего из table не переносится,
+    см. SqlAlc.shadow_loss
+    :param dialect: SqlAlc.dialect
+    :param columns: столбцы таблицы из TABLES, первым идёт ключ uid
+    :param stamp: уникальная метка загрузки для имени ключа: имена ключей и индексов не должны совпадать
+        с ключом текущей таблицы, который останется у неё до замены
+    :return: словарь с запросами create, insert (с параметрами :name), finish, swap, drop
+    """
+    shadow, old, names = f"{table}_load", f"{table}_old", ",".join(columns)
+    # порядок вставки: rowid в SQLite, в остальных - столбец load_seq, который удаляется перед построением ключа
+    seq = "rowid" if dialect == "sqlite" else "load_seq"
+    latest = (f"ROW_NUMBER() OVER (PARTITION BY uid ORDER BY update_time DESC"
+              f"{' NULLS LAST' if dialect == 'postgresql' else ''}, {seq} DESC) AS n")
+    if dialect == "mssql":
+        create = (f"SELECT TOP 0 {names}, IDENTITY(bigint, 1, 1) AS load_seq INTO {shadow} FROM {table}",)
+        finish = (f"WITH D AS (SELECT {latest} FROM {shadow}) DELETE FROM D WHERE n > 1",
+                  f"ALTER TABLE {shadow} DROP COLUMN load_seq",
+                  f"ALTER TABLE {shadow} ADD CONSTRAINT PK_{table}_{stamp} PRIMARY KEY CLUSTERED (uid)")
+        swap = (f"EXEC sp_rename '{table}', '{old}'", f"EXEC sp_rename '{shadow}', '{table}'")
+        drop = f"IF OBJECT_ID('{shadow}') IS NOT NULL DROP TABLE {shadow}"
+    else:
+        create = (f"CREATE TABLE {shadow} AS SELECT {names} FROM {table} "
+                  f"{'WHERE 0' if dialect == 'sqlite' else 'WITH NO DATA'}",)
+        dedup = (f"DELETE FROM {shadow} WHERE {seq} IN "
+                 f"(SELECT {seq} FROM (SELECT {seq}, {latest} FROM {shadow}) AS D WHERE n > 1)")
+        if dialect == "sqlite":
+            finish = (dedup, f"CREATE UNIQUE INDEX {table}_uid_{stamp} ON {shadow} (uid)")
+        else:
+            create += (f"ALTER TABLE {shadow} ADD COLUMN load_seq bigserial",)
+            finish = (dedup, f"ALTER TABLE {shadow} DROP COLUMN load_seq",
+                      f"ALTER TABLE {shadow} ADD CONSTRAINT {table}_pk_{stamp} PRIMARY KEY (uid)")
+        swap = (f"ALTER TABLE {table} RENAME TO {old}", f"ALTER TABLE {shadow} RENAME TO {table}")
+        drop = f"DROP TABLE IF EXISTS {shadow}"
+    return {"create": create, "drop": drop, "finish": finish, "swap": swap + (f"DROP TABLE {old}",),
+            "insert": f"INSERT INTO {shadow} ({names}) VALUES ({','.join(':' + c for c in columns)})"}
+
+
+def newest(rows, columns):
+    """
+    Оставляет по одной записи на uid - с самым поздним update_time, при равном - последнюю\n
+    MERGE и ON CONFLICT не обновляют одну строку дважды, поэтому пакет для staged_upsert не должен
+    содержать повторов
+    :param rows: кортежи значений в порядке columns
+    """
+    time = columns.index("update_time")
+    latest = {}
+    for row in rows:
+        previous = latest.get(row[0])
+        if previous is None or previous[time] is None or row[time] is not None and row[time] >= previous[time]:
+            latest[row[0]] = row
+    return list(latest.values())
 
 
 class SqlAlc:
-    def __init__(self, dsn, verbose=True):
+    def __init__(self, dsn, verbose=True, bulk=True, writers=1):
         """
-        :param dsn: connection string
+        :param dsn: connection string. Кроме MS SQL поддерживается SQLite (sqlite:///path.db) для локальных тестов
+            и PostgreSQL для пакетного обновления
         :param verbose: True чтобы выводить информацию об успешном завершении работы методов,
         False будет выводить только данные об ошибках
+        :param bulk: True, чтобы обновлять пакеты через временную таблицу (staged_upsert),
+            False - отдельным запросом на каждую строку
+        :param writers: сколько потоков PartitionedWriter пишут одновременно. Под них держится пул соединений,
+            а MERGE блокирует строки (ROWLOCK) вместо диапазонов ключей, которые мешали бы соседним потокам
         """
         self.__engine = None
         self.verbose = verbose
+        self.bulk = bulk
+        self.writers = max(writers, 1)
+        self.lock = "SERIALIZABLE" if self.writers == 1 else "ROWLOCK"
+        self.stats = {}  # таблица -> счётчики записей за время работы, см. report()
+        self.__shadow = {}  # таблица -> запросы shadow_load, пока идёт её полная загрузка
+        self.__lock = threading.Lock()
+        self.dialect = None
         try:
-            self.__engine = create_engine(dsn, fast_executemany=True)
+            self.dialect = make_url(dsn).get_backend_name()
+            if self.dialect == "mssql":
+                self.__engine = create_engine(dsn, fast_executemany=True, pool_size=self.writers + 1)
+            elif self.dialect == "sqlite":
+                self.__engine = create_engine(dsn)  # SQLite открывает соединение на каждую транзакцию
+                SqlAlc.__immediate(self.__engine)
+            else:
+                self.__engine = create_engine(dsn, pool_size=self.writers + 1)
         except Exception as e:
             logger.error(e)
 
-    def update_many_types(self, types, table="HospitalTypes"):
-        data = list(t.__dict__ for t in types)
-        if data is not None and len(data) != 0:
+    @staticmethod
+    def __immediate(engine):
+        """
+        Транзакции SQLite начинаются с BEGIN IMMEDIATE: параллельные писатели ждут блокировку записи
+        в начале транзакции, а не получают "database is locked" при попытке записать после чтения
+        """
+        @event.listens_for(engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None  # BEGIN выполняет SqlAlchemy, а не sqlite3
+
+        @event.listens_for(engine, "begin")
+        def begin(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    def create_tables(self):
+        """Создаёт недостающие таблицы в базе SQLite, схемой MS SQL этот класс не управляет"""
+        if self.dialect != "sqlite":
+            logger.warning(f"Cannot create tables for {self.dialect}")
+            return
+        with self.__engine.begin() as c:
+            for table, columns in TABLES.items():
+                c.execute(text(f"CREATE TABLE IF NOT EXISTS {table} "
+                               f"(uid INTEGER PRIMARY KEY, {','.join(columns[1:])})"))
+
+    @staticmethod
+    def __rows(items, fields):
+        if isinstance(items, Batch): return items.rows(fields)
+        return list(map(Base.getter(fields), items))
+
+    def __write(self, c, table, items, columns):
+        """
+        Записывает пакет в открытой транзакции c\n
+        Существующая запись не заменяется более старой по update_time, поэтому пакеты можно записывать
+        в любом порядке. При равном update_time (одна загрузка) остаётся запись, записанная последней
+        :return: счётчики input, inserted, updated, skipped. Без bulk известен только input
+        """
+        paramstyle = self.__engine.dialect.paramstyle
+        if not self.bulk:
+            sql, fields = positional(row_upsert(self.dialect, table, columns, self.lock), paramstyle)
+            data = SqlAlc.__rows(items, fields)
+            c.exec_driver_sql(sql, data)
+            return {"input": len(data)}
+
+        prepare, insert, matched, apply, cleanup = staged_upsert(self.dialect, table, columns, self.lock)
+        sql, fields = positional(insert, paramstyle)
+        data = newest(SqlAlc.__rows(items, fields), fields)
+        for statement in prepare: c.exec_driver_sql(statement)
+        c.exec_driver_sql(sql, data)
+        matched = c.exec_driver_sql(matched).scalar()
+        changed = c.exec_driver_sql(apply).rowcount
+        for statement in cleanup: c.exec_driver_sql(statement)
+        inserted = len(data) - matched
+        return {"input": len(data), "inserted": inserted, "updated": changed - inserted,
+                "skipped": matched - (changed - inserted)}
+
+    def __insert(self, c, shadow, items):
+        """Записывает пакет в теневую таблицу полной загрузки без проверки существующих записей"""
+        sql, fields = positional(shadow["insert"], self.__engine.dialect.paramstyle)
+        data = SqlAlc.__rows(items, fields)
+        c.exec_driver_sql(sql, data)
+        return {"input": len(data), "inserted": len(data)}
+
+    def __update_many(self, table, items, columns):
+        """
+        Общая часть методов update_many_*\n
+        :param items: Batch или список объектов моделей
+        :param columns: столбцы таблицы из TABLES
+        """
+        if items is not None and len(items) != 0:
+            shadow = self.__shadow.get(table)
             with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(
-                        f"MERGE {table} WITH (SERIALIZABLE) AS T USING (VALUES (:uid, :name, :parent_id, :update_time))"
-                        " AS U (uid, name, parent_id, update_time) ON U.uid = T.uid "
-                        "WHEN MATCHED THEN UPDATE SET T.name=U.name,T.parent_id=U.parent_id,T.update_time=U.update_time"
-                        " WHEN NOT MATCHED THEN INSERT "
-                        "(uid, name, parent_id, update_time) VALUES (U.uid, U.name, U.parent_id, U.update_time);"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
+                if shadow is not None: counts = self.__insert(c, shadow, items)
+                else: counts = self.__write(c, table, items, columns)
+            with self.__lock:
+                total = self.stats.setdefault(table, {})
+                for key, value in counts.items(): total[key] = total.get(key, 0) + value
+            if self.verbose:
+                logger.info(f"Update is done ({', '.join(f'{k}: {v}' for k, v in counts.items())})")
         else:
-            logger.warning("Cannot update empty data")
+            logger.debug("Nothing to update")  # ChangeFilter и Dedup могут убрать из пакета все записи
+
+    def update_many_types(self, types, table="HospitalTypes"):
+        self.__update_many(table, types, TABLES["HospitalTypes"])
 
     def update_many_addresses(self, addresses, table="Addresses"):
-        data = list(t.__dict__ for t in addresses)
-        if data is not None and len(data) != 0:
-            with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(f"UPDATE {table} SET country=:country,area=:area,region=:region,city=:city,city_id=:city_id,"
-                         "street=:street,building=:building,house=:house,flat=:flat,update_time=:update_time,"
-                         "type_street=:type_street WHERE uid=:uid "
-                         "IF @@ROWCOUNT=0 "
-                         f"INSERT {table} (country,area,region,city,city_id,type_street,street,building,house,flat,uid)"
-                         " VALUES (:country,:area,:region,:city,:city_id,:type_street,:street,:building,:house,:flat,:uid)"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
-        else:
-            logger.warning("Cannot update empty data")
+        self.__update_many(table, addresses, TABLES["Addresses"])
 
     def update_many_hospitals(self, hospitals, table="Hospitals"):
-        data = list(t.__dict__ for t in hospitals)
-        if data is not None and len(data) != 0:
-            with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(f"MERGE {table} WITH (SERIALIZABLE) AS T USING (VALUES "
-                         "(:uid,:name,:type_id,:property_form,:is_archive,:tax_code,:corp_id,:center_id,:phones,"
-                         ":br_nick,:status,:update_time)) "
-                         "AS U (uid,name,type_id,property_form,is_archive,tax_code,corp_id,center_id,phones,"
-                         "br_nick,status,update_time) ON U.uid = T.uid "
-                         "WHEN MATCHED THEN UPDATE SET T.name=U.name, T.type_id=U.type_id, T.property_form=U.property_form,"
-                         "T.is_archive=U.is_archive,T.tax_code=U.tax_code,T.corp_id=U.corp_id,T.center_id=U.center_id,"
-                         "T.phones=U.phones,T.br_nick=U.br_nick,T.status=U.status,T.update_time=U.update_time"
-                         " WHEN NOT MATCHED THEN INSERT "
-                         "(uid,name,type_id,property_form,is_archive,tax_code,corp_id,center_id,phones,br_nick,status,update_time) "
-                         "VALUES (U.uid,U.name,U.type_id,U.property_form,U.is_archive,U.tax_code,U.corp_id,U.center_id,"
-                         "U.phones,U.br_nick,U.status,U.update_time);"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
-        else:
-            logger.warning("Cannot update empty data")
+        self.__update_many(table, hospitals, TABLES["Hospitals"])
 
     def update_many_employees(self, persons, table="Employee"):
-        data = list(t.__dict__ for t in persons)
-        if data is not None and len(data) != 0:
-            with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(f"UPDATE {table} SET firstname=:firstname,lastname=:lastname,secondname=:secondname,"
-                         "is_archive=:is_archive,status=:status,sex=:sex,update_time=:update_time "
-                         "WHERE uid=:uid IF @@ROWCOUNT=0 "
-                         f"INSERT INTO {table} (firstname,lastname,secondname,is_archive,status,sex,update_time,uid) "
-                         "VALUES (:firstname,:lastname,:secondname,:is_archive,:status,:sex,:update_time,:uid)"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
-        else:
-            logger.warning("Cannot update empty data")
+        self.__update_many(table, persons, TABLES["Employee"])
 
     def update_many_jobs(self, jobs, table="Jobs"):
-        data = list(t.__dict__ for t in jobs)
-        if data is not None and len(data) != 0:
-            with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(f"UPDATE {table} SET person_id=:person_id,is_main=:is_main,is_archive=:is_archive,"
-                         "post_id=:post_id,status=:status,org_id=:org_id,update_time=:update_time "
-                         "WHERE uid=:uid IF @@ROWCOUNT=0 "
-                         f"INSERT INTO {table} (person_id,is_main,is_archive,post_id,status,org_id,update_time,uid) "
-                         "VALUES (:person_id,:is_main,:is_archive,:post_id,:status,:org_id,:update_time,:uid)"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
-        else:
-            logger.warning("Cannot update empty data")
+        self.__update_many(table, jobs, TABLES["Jobs"])
 
     def update_many_specs(self, specs, table="Specialists"):
-        data = list(t.__dict__ for t in specs)
-        if data is not None and len(data) != 0:
-            with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(f"UPDATE {table} SET name=:name,category=:category,is_main=:is_main,update_time=:update_time "
-                         "WHERE uid=:uid IF @@ROWCOUNT=0 "
-                         f"INSERT INTO {table} (name,category,is_main,update_time,uid) "
-                         "VALUES (:name,:category,:is_main,:update_time,:uid)"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
-        else:
-            logger.warning("Cannot update empty data")
+        self.__update_many(table, specs, TABLES["Specialists"])
 
     def update_many_posts(self, posts, table="Posts"):
-        data = list(t.__dict__ for t in posts)
-        if data is not None and len(data) != 0:
+        self.__update_many(table, posts, TABLES["Posts"])
+
+    def shadow_loss(self, *tables):
+        """
+        Что потеряли бы tables после замены теневыми таблицами shadow_load: индексы и ограничения, кроме ключа uid,
+        значения по умолчанию, внешние ключи этой таблицы и других таблиц на неё, триггеры, права доступа
+        и представления. Внешний ключ другой таблицы или представление к тому же не дали бы удалить прежнюю
+        таблицу после замены, а SQLite при переименовании перенёс бы представление на удаляемую таблицу\n
+        :param tables: имена таблиц из TABLES
+        :return: описания потерянного, пустой список, если полная загрузка через теневые таблицы безопасна
+        """
+        inspector, lost = inspect(self.__engine), []
+
+        def reflect(method, table):
+            try:
+                return getattr(inspector, method)(table)
+            except NotImplementedError:  # не все диалекты SqlAlchemy отражают, например, CHECK
+                return []
+
+        def is_key(columns):
+            return list(columns) == ["uid"]
+
+        others = [t for t in inspector.get_table_names() if t not in tables]
+        for table in tables:
+            key = inspector.get_pk_constraint(table)["constrained_columns"]
+            if key and not is_key(key): lost.append(f"{table} primary key ({','.join(key)})")
+            lost += [f"{table} index {i['name']}" for i in reflect("get_indexes", table)
+                     if not (i["unique"] and is_key(i["column_names"]))]
+            lost += [f"{table} unique constraint {u['name']}" for u in reflect("get_unique_constraints", table)
+                     if not is_key(u["column_names"])]
+            lost += [f"{table} check {c['name'] or c['sqltext']}" for c in reflect("get_check_constraints", table)]
+            lost += [f"{table}.{c['name']} default" for c in inspector.get_columns(table)
+                     if c.get("default") is not None]
+            lost += [f"{table} foreign key ({','.join(f['constrained_columns'])})"
+                     for f in inspector.get_foreign_keys(table)]
+            lost += [f"{other} foreign key ({','.join(f['constrained_columns'])}) to {table}" for other in others
+                     for f in inspector.get_foreign_keys(other) if f["referred_table"] == table]
+            lost += [f"{table} trigger {name}" for name in self.__dependents("trigger", table)]
+            lost += [f"{table} view {name}" for name in self.__dependents("view", table)]
+            lost += [f"{table} grant to {name}" for name in self.__dependents("grant", table)]
+        return lost
+
+    __DEPENDENTS = {
+        "trigger": {
+            "mssql": "SELECT name FROM sys.triggers WHERE parent_id = OBJECT_ID(:table)",
+            "sqlite": "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :table",
+            "postgresql": "SELECT tgname FROM pg_trigger WHERE tgrelid = CAST(:table AS regclass) AND NOT tgisinternal",
+        },
+        "view": {
+            "mssql": "SELECT DISTINCT OBJECT_NAME(d.referencing_id) FROM sys.sql_expression_dependencies d "
+                     "JOIN sys.views v ON v.object_id = d.referencing_id WHERE d.referenced_id = OBJECT_ID(:table)",
+            # SQLite не хранит зависимостей: представление ищется по имени таблицы в его тексте
+            "sqlite": "SELECT name FROM sqlite_master WHERE type = 'view' AND instr(lower(sql), lower(:table)) > 0",
+            "postgresql": "SELECT DISTINCT v.relname FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid "
+                          "JOIN pg_class v ON v.oid = r.ev_class "
+                          "WHERE d.refobjid = CAST(:table AS regclass) AND v.oid <> d.refobjid",
+        },
+        "grant": {
+            "mssql": "SELECT DISTINCT USER_NAME(grantee_principal_id) FROM sys.database_permissions "
+                     "WHERE class = 1 AND major_id = OBJECT_ID(:table)",
+            "sqlite": None,  # в SQLite нет прав доступа
+            "postgresql": "SELECT DISTINCT CASE a.grantee WHEN 0 THEN 'PUBLIC' ELSE pg_get_userbyid(a.grantee) END "
+                          "FROM pg_class c, aclexplode(c.relacl) a "
+                          "WHERE c.oid = CAST(:table AS regclass) AND a.grantee <> c.relowner",
+        },
+    }
+
+    def __dependents(self, kind, table):
+        """
+        Имена объектов, которые SqlAlchemy не отражает, но которые привязаны к table и не перейдут
+        на теневую таблицу\n
+        :param kind: "trigger" - триггеры table, "view" - представления, читающие table,
+            "grant" - пользователи и роли с правами на table, кроме владельца
+        """
+        queries = SqlAlc.__DEPENDENTS[kind]
+        sql = queries.get(self.dialect, queries["postgresql"])
+        if sql is None:
+            return []
+        with self.__engine.begin() as c:
+            return [row[0] for row in c.execute(text(sql), {"table": table})]
+
+    def begin_full_load(self, *tables, resume=False):
+        """
+        Начинает полную загрузку tables: до finish_full_load update_many_* пишут в теневые таблицы {table}_load,
+        а читатели продолжают видеть прежние данные\n
+        :param tables: имена таблиц из TABLES
+        :param resume: True, чтобы продолжить загрузку в теневые таблицы, оставшиеся от прерванного запуска
+        :return: True, если продолжены оставшиеся теневые таблицы, False, если созданы новые пустые
+        :raise ValueError: если после замены tables потеряли бы индексы, ограничения, триггеры, права или представления
+            (shadow_loss)
+        """
+        lost = self.shadow_loss(*tables)
+        if lost:
+            raise ValueError(f"Shadow tables would lose {', '.join(lost)}.")
+        stamp = time.time_ns() // 1000
+        existing = set(inspect(self.__engine).get_table_names())
+        kept = resume and all(f"{table}_load" in existing for table in tables)
+        with self.__engine.begin() as c:
+            for table in tables:
+                self.__shadow[table] = shadow_load(self.dialect, table, TABLES[table], stamp)
+                if not kept:
+                    c.exec_driver_sql(self.__shadow[table]["drop"])
+                    for statement in self.__shadow[table]["create"]: c.exec_driver_sql(statement)
+        logger.info(f"{'Resuming' if kept else 'Starting'} full load of {', '.join(tables)} into shadow tables.")
+        return kept
+
+    def finish_full_load(self, *tables):
+        """
+        Строит ключ uid теневых таблиц и в одной транзакции заменяет ими tables, прежние таблицы удаляются\n
+        Все tables заменяются одновременно, читатели не увидят, например, новых Employee со старыми Jobs
+        """
+        for table in tables:
             with self.__engine.begin() as c:
-                if self.verbose: count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0]
-                c.execute(
-                    text(f"UPDATE {table} SET name=:name,type=:type,update_time=:update_time WHERE uid=:uid "
-                         f"IF @@ROWCOUNT=0 "
-                         f"INSERT INTO {table} (name,type,update_time,uid) VALUES (:name,:type,:update_time,:uid)"),
-                    data)
-                if self.verbose:
-                    count = c.execute(text(f"SELECT count(*) FROM {table}")).fetchone()[0] - count
-                    logger.info(f"Update is done (inpt: {len(data)}, cnng: {count:+d})")
-        else:
-            logger.warning("Cannot update empty data")
+                for statement in self.__shadow[table]["finish"]: c.exec_driver_sql(statement)
+        with self.__engine.begin() as c:
+            for table in tables:
+                for statement in self.__shadow[table]["swap"]: c.exec_driver_sql(statement)
+        for table in tables:
+            del self.__shadow[table]
+        logger.info(f"Full load of {', '.join(tables)} is swapped in.")
+
+    def cancel_full_load(self, *tables, drop=False):
+        """
+        Возвращает update_many_* к обновлению tables\n
+        :param drop: True, чтобы удалить теневые таблицы, False, чтобы оставить их для begin_full_load(resume=True)
+        """
+        for table in tables:
+            shadow = self.__shadow.pop(table)
+            if drop:
+                with self.__engine.begin() as c:
+                    c.exec_driver_sql(shadow["drop"])
+
+    def report(self):
+        """Пишет в лог, сколько записей каждой таблицы вставлено, обновлено и пропущено как более старые"""
+        with self.__lock:
+            for table, total in self.stats.items():
+                logger.info(f"{table}: {', '.join(f'{k} {v}' for k, v in total.items())}.")
 
     def count_items(self, table):
         with self.__engine.begin() as c:
@@ -2,7 +2,7 @@ import logging
 from Settings.Manager import get_severity, args_parser, severity_from_str
 
 
-args = args_parser.parse_args()
+args, _ = args_parser.parse_known_args()  # свои аргументы есть и у утилит в Testing
 if args.sev is not None:
     severity = severity_from_str(args.sev)
     print(f"Severity set to {args.sev}")
@@ -7,6 +7,17 @@ import logging
 args_parser = argparse.ArgumentParser()
 args_parser.add_argument('--sev', help=f'Logging severity level, can be "DEBUG", "INFO", "WARN". '
                                        f'Script uses value in config by default')
+args_parser.add_argument('--resume', action='store_true',
+                         help='Skip pages saved by the previous interrupted run instead of starting from scratch')
+args_parser.add_argument('--rewrite', action='store_true',
+                         help='Write every received row, even if it has not changed since the previous run')
+args_parser.add_argument('--full', action='store_true',
+                         help='Reload all persons and hospitals into shadow tables and swap them in when done')
+args_parser.add_argument('--record', metavar='DIR',
+                         help='Write every received API page to a new gzip NDJSON file in DIR, one file per run')
+args_parser.add_argument('--replay', metavar='PATH',
+                         help='Load data from an archive directory written with --record (or one of its files) '
+                              'instead of the API')
 
 
 def get_proxies():
@@ -35,6 +46,11 @@ def get_api_wait_time():
         return json.load(f)["API"]["WAIT_TIME"]
 
 
+def get_api_min_wait_time():
+    with open("Settings/config.json") as f:
+        return json.load(f)["API"].get("MIN_WAIT_TIME", 5)
+
+
 def get_sql_dsn():
     with open("Settings/config.json") as f:
         return json.load(f)["SQL"]["DSN"]
@@ -45,6 +61,11 @@ def get_sqlalchemy_dsn():
         return json.load(f)["SQL"]["DSN_SqlAlchemy"]
 
 
+def get_db_writers():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["SQL"].get("WRITERS", 1))
+
+
 def get_update_time():
     with open("Settings/config.json") as f:
         return json.load(f)["RUNTIME"]["UPDATE"]
@@ -65,6 +86,57 @@ def get_parallel():
         return int(json.load(f)["API"]["THREADS"])
 
 
+def get_min_parallel():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["API"].get("MIN_THREADS", 1))
+
+
+def get_pool_size():
+    with open("Settings/config.json") as f:
+        api = json.load(f)["API"]
+        return int(api["POOL_SIZE"]) if "POOL_SIZE" in api else None
+
+
+def get_writers():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["API"].get("WRITERS", 1))
+
+
+def get_queue_size():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["API"].get("QUEUE_SIZE", 16))
+
+
+def get_coalesce():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["API"].get("COALESCE", 0))
+
+
+def get_linger():
+    with open("Settings/config.json") as f:
+        return float(json.load(f)["API"].get("LINGER", 5))
+
+
+def get_parse_workers():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["API"].get("PARSE_WORKERS", 0))
+
+
+def get_checkpoint_path():
+    with open("Settings/config.json") as f:
+        return json.load(f)["RUNTIME"].get("CHECKPOINT", "Settings/checkpoint.db")
+
+
+def get_change_index_path():
+    with open("Settings/config.json") as f:
+        return json.load(f)["RUNTIME"].get("CHANGE_INDEX", "Settings/changes.db")
+
+
+def get_dedup_capacity():
+    with open("Settings/config.json") as f:
+        return int(json.load(f)["RUNTIME"].get("DEDUP_CAPACITY", 200000))
+
+
 def reset_update_time(time=None):
     with open("Settings/config.json", "r") as f:
         data = json.load(f)
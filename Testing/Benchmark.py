@@ -0,0 +1,217 @@
+"""
+Сквозной замер производительности загрузки: ProximaREST -> Parsers -> SqlAlc\n
+Данные отдаёт локальный MockProxima, запись идёт в файл SQLite. Для каждого сценария и числа потоков
+считаются записи и страницы в секунду, перцентили задержки страниц, время записи одного пакета в БД
+и пиковая память процесса. Результаты сохраняются в JSON, чтобы сравнивать версии и настройки.
+Запуск: python -m Testing.Benchmark --persons 50000 --threads 4 8 16 --latency 0.2 --output bench.json --sev WARN
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from Services.ProximaREST import ProximaREST
+from Services.Retry import RetryPolicy
+from Services.SqlAlc import SqlAlc
+from Services.Dedup import Dedup
+from Services.PartitionedWriter import PartitionedWriter
+from Testing.ProximaMock import MockProxima, Dataset
+
+
+SCENARIOS = ("persons", "hospitals", "recent_persons", "recent_hospitals")
+FULL_LOAD = {"persons": ("Employee", "Specialists", "Jobs"), "hospitals": ("Hospitals", "Addresses")}
+
+
+def percentile(values, q):
+    """Перцентиль q (0..100) методом ближайшего ранга, None для пустого списка"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def peak_rss_mb():
+    """Пиковый размер резидентной памяти процесса с момента запуска, None, если его нельзя узнать"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+class Recorder:
+    """Собирает задержки страниц (ProximaREST.on_page) и время записи пакетов (обёртка над callback)"""
+
+    def __init__(self):
+        self.pages = []
+        self.batches = []
+        self.records = 0
+        self.items = 0
+        self.__lock = threading.Lock()
+
+    def on_page(self, method, skip, seconds):
+        with self.__lock:
+            self.pages.append(seconds)
+
+    def sink(self, callback):
+        def save(*items):
+            started = time.perf_counter()
+            callback(*items)
+            elapsed = time.perf_counter() - started
+            with self.__lock:
+                self.batches.append(elapsed)
+                self.records += len(items[0])
+                self.items += sum(map(len, items))
+        return save
+
+    def summary(self, elapsed):
+        def ms(value):
+            return None if value is None else round(value * 1000, 2)
+
+        return {"elapsed_s": round(elapsed, 3),
+                "records": self.records,
+                "items": self.items,
+                "pages": len(self.pages),
+                "records_per_s": round(self.records / elapsed, 1) if elapsed else None,
+                "pages_per_s": round(len(self.pages) / elapsed, 2) if elapsed else None,
+                "page_latency_ms": {f"p{q}": ms(percentile(self.pages, q)) for q in (50, 95, 99)},
+                "db_batch_ms": {"count": len(self.batches),
+                                "mean": ms(sum(self.batches) / len(self.batches)) if self.batches else None,
+                                "p50": ms(percentile(self.batches, 50)),
+                                "p95": ms(percentile(self.batches, 95)),
+                                "total": ms(sum(self.batches))},
+                "peak_rss_mb": peak_rss_mb()}
+
+
+def sinks(sql):
+    """Функции сохранения для каждого сценария, те же, что в main.py. sql=None - данные никуда не пишутся"""
+    if sql is None:
+        return {name: lambda *items: None for name in SCENARIOS}
+
+    def save_hospitals(hospitals, addresses):
+        sql.update_many_hospitals(hospitals)
+        sql.update_many_addresses(addresses)
+
+    def save_persons(persons, specialists, jobs):
+        sql.update_many_employees(persons)
+        sql.update_many_specs(specialists)
+        sql.update_many_jobs(jobs)
+
+    return {"persons": save_persons, "recent_persons": save_persons,
+            "hospitals": save_hospitals, "recent_hospitals": save_hospitals}
+
+
+def run(mock, scenario, args, threads):
+    """Один прогон сценария на свежей базе, возвращает словарь с результатами"""
+    fd, path = tempfile.mkstemp(suffix=".db", prefix="proxima-bench-") if args.db is None else (None, args.db)
+    if fd is not None: os.close(fd)
+    sql = None
+    if args.sink == "sqlalc":
+        sql = SqlAlc(f"sqlite:///{path}", verbose=not args.quiet_sql, bulk=not args.row_upsert,
+                     writers=args.db_writers)
+        sql.create_tables()
+
+    recorder = Recorder()
+    api = ProximaREST(mock.url, "bench", "bench", threads=threads, min_threads=min(args.min_threads, threads),
+                      writers=args.writers, queue_size=args.queue_size, page_size=args.page_size,
+                      wait_time=args.wait_time, min_wait_time=args.min_wait_time, stream=args.stream,
+                      retry=RetryPolicy(args.retries, args.timeout, base_delay=args.retry_delay),
+                      on_page=recorder.on_page, parse_workers=args.parse_workers,
+                      coalesce=args.coalesce, linger=args.linger)
+    update = mock.dataset.now - int(args.recent_days * 86400)
+    kwargs = {"update": update} if scenario.startswith("recent_") else {}
+    writer = PartitionedWriter(sinks(sql)[scenario], args.db_writers)
+    sink = Dedup(writer) if args.dedup else writer
+    full_load = args.full_load and sql is not None and scenario in FULL_LOAD
+    try:
+        started = time.perf_counter()
+        if full_load: sql.begin_full_load(*FULL_LOAD[scenario])
+        getattr(api, f"get_{scenario}")(recorder.sink(sink), nmax=args.nmax, **kwargs)
+        if full_load: sql.finish_full_load(*FULL_LOAD[scenario])
+        elapsed = time.perf_counter() - started
+    finally:
+        api.close()
+        writer.close()
+        if fd is not None: os.remove(path)
+    return {"scenario": scenario, "threads": threads, "writers": args.writers, "coalesce": args.coalesce,
+            "page_size": args.page_size, "sink": args.sink, "bulk": not args.row_upsert, "full_load": full_load,
+            "db_writers": args.db_writers, "dedup": args.dedup, "stream": api.stream,
+            "parse_workers": args.parse_workers, "concurrency_limit": api.concurrency.limit,
+            **recorder.summary(elapsed), "db_rows": None if sql is None else sql.stats}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end extract/load benchmark against a local Proxima mock")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--threads", nargs="+", type=int, default=[8], help="one run per value")
+    parser.add_argument("--min-threads", type=int, default=1)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--coalesce", type=int, default=0, help="rows per table to buffer before writing")
+    parser.add_argument("--linger", type=float, default=5.0, help="max seconds a page waits in the buffer")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--nmax", type=int, default=None)
+    parser.add_argument("--stream", action="store_true", help="parse pages while they are received")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse pages in this many processes")
+    parser.add_argument("--sink", choices=("sqlalc", "none"), default="sqlalc")
+    parser.add_argument("--dedup", action="store_true", help="drop repeated uids before writing")
+    parser.add_argument("--quiet-sql", action="store_true", help="no log line per SqlAlc batch")
+    parser.add_argument("--db-writers", type=int, default=1, help="connections writing parts of each page")
+    parser.add_argument("--full-load", action="store_true", help="load persons/hospitals into shadow tables and swap")
+    parser.add_argument("--row-upsert", action="store_true", help="one upsert statement per row, no staging table")
+    parser.add_argument("--db", help="SQLite file to write into, a temporary file per run by default")
+    parser.add_argument("--persons", type=int, default=20000)
+    parser.add_argument("--orgs", type=int, default=10000)
+    parser.add_argument("--recent-days", type=float, default=3, help="update window of the recent_* scenarios")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--waiting", type=float, default=0.0, help="share of requests answered IN_PROGRESS")
+    parser.add_argument("--ready-delay", type=float, default=1.0)
+    parser.add_argument("--errors", type=float, default=0.0, help="share of requests answered with HTTP 503")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--retry-delay", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--wait-time", type=float, default=10)
+    parser.add_argument("--min-wait-time", type=float, default=0.5)
+    parser.add_argument("--label", default="", help="free text stored with the results, e.g. a version")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--sev", help="logging severity, e.g. WARN to hide per-page messages")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    dataset = Dataset(persons=args.persons, orgs=args.orgs)
+    results = []
+    with MockProxima(dataset, latency=args.latency, jitter=args.jitter, waiting_share=args.waiting,
+                     ready_delay=args.ready_delay, error_share=args.errors) as mock:
+        for scenario in args.scenarios:
+            for threads in args.threads:
+                result = run(mock, scenario, args, threads)
+                results.append(result)
+                print(f"{scenario:>16} threads={threads:<3} {result['records_per_s']:>10} rec/s "
+                      f"{result['pages_per_s']:>8} pages/s  p95 {result['page_latency_ms']['p95']} ms  "
+                      f"db p50 {result['db_batch_ms']['p50']} ms  rss {result['peak_rss_mb']} MB")
+
+    report = {"label": args.label,
+              "started": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "args": vars(args),
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results are saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Микро-замеры построчной работы: шаблоны запросов, разбор JSON, Serializers, конструкторы Models,
+Parsers и извлечение параметров запросов SqlAlc\n
+Каждый этап обрабатывает 1000 строк (одну страницу) синтетических данных Testing.ProximaMock.Dataset,
+для него считается время и память на 1000 строк. Результат сравнивается с сохранённым базовым замером,
+при регрессии больше порога, подтверждённой повторными замерами, скрипт завершается с кодом 1.
+Запуск: python -m Testing.MicroBench [--save-baseline] [--threshold 0.3]
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+from Settings.Logger import logger
+from Services.ProximaHelpers import Serializers, Parsers, ProximaMethods
+from Services.SqlAlc import TABLES
+from Models.BaseModel import Base
+from Models.Hospital import Hospital
+from Models.Person import Person
+import Services.ProximaTemplates as Templates
+import Services.ProximaJson as ProximaJson
+from Testing.ProximaMock import Dataset
+
+
+BASELINE = "Testing/microbench_baseline.json"
+ROWS = 1000
+
+
+def stages(dataset):
+    """Словарь {название: функция без аргументов, обрабатывающая ROWS строк}"""
+    persons = dataset.page(ProximaMethods.persons(), 0, ROWS)["result"]
+    orgs = dataset.page(ProximaMethods.hospitals(), 0, ROWS)["result"]
+    specs = [s for p in persons for s in p["get_spec"]["result"]][:ROWS]
+    jobs = [j for p in persons for j in p["get_job"]["result"]][:ROWS]
+    addresses = [o["get_address"]["result"][0] for o in orgs if o["get_address"]["result"]]
+    persons_page = ProximaJson.dumps({ProximaMethods.persons(): {"fetch": ROWS, "more": True, "result": persons}})
+    parsed = Parsers.persons(persons)[0]
+    objects = list(parsed)
+    getter = Base.getter(TABLES["Employee"])
+    hospital_args = [(o["org_name"], o["org_id"], o["type_org_id"]) for o in orgs]
+    person_args = [(p["firstname"], p["lastname"], p["secondname"], p["person_id"]) for p in persons]
+
+    return {
+        "template.persons": lambda: Templates.persons(0, ROWS),
+        "template.recent_hospitals": lambda: Templates.recent_hospitals(0, ROWS, dataset.now),
+        "decode.persons": lambda: ProximaJson.loads(persons_page),
+        "serializer.person": lambda: [Serializers.person_from_json(p) for p in persons],
+        "serializer.hospital": lambda: [Serializers.hospital_from_json(o) for o in orgs],
+        "serializer.person_row": lambda: [Serializers.person_row(p, dataset.now) for p in persons],
+        "serializer.hospital_row": lambda: [Serializers.hospital_row(o, dataset.now) for o in orgs],
+        "serializer.address_row": lambda: [Serializers.address_row(a, dataset.now) for a in addresses],
+        "serializer.spec_row": lambda: [Serializers.spec_row(s, dataset.now) for s in specs],
+        "serializer.job_row": lambda: [Serializers.job_row(j, dataset.now) for j in jobs],
+        "model.hospital": lambda: [Hospital(*a) for a in hospital_args],
+        "model.person": lambda: [Person(*a) for a in person_args],
+        "parser.persons": lambda: Parsers.persons(persons),
+        "parser.hospitals": lambda: Parsers.hospitals(orgs),
+        "extract.params": lambda: [getter(p) for p in objects],
+        "extract.tuple": lambda: [p.to_tuple() for p in objects],
+        "extract.batch": lambda: parsed.rows(TABLES["Employee"]),
+    }
+
+
+def reference():
+    """Эталонная нагрузка на чистом Python, в единицах её времени сравниваются замеры разных запусков и машин"""
+    return sorted(str(i * 7919 % 1000) for i in range(ROWS))
+
+
+def best_ms(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1000
+
+
+def measure(fn, repeat):
+    """
+    Лучшее время одного вызова fn в миллисекундах, пиковая и оставшаяся после вызова память\n
+    rel - медиана отношений времени fn к времени reference, замеренному непосредственно перед fn в том же
+    повторе: так меньше влияют соседние процессы и частота процессора, а один удачный или неудачный
+    повтор не сдвигает результат
+    """
+    ms, ratios = float("inf"), []
+    for _ in range(repeat):
+        ref = best_ms(reference, 1)
+        elapsed = best_ms(fn, 1)
+        ms = min(ms, elapsed)
+        ratios.append(elapsed / ref)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(s.count_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    del result
+    return {"ms": round(ms, 4), "rel": round(statistics.median(ratios), 4), "peak_kb": round((peak - start) / 1024, 1),
+            "retained_kb": round((current - start) / 1024, 1), "blocks_per_row": round(blocks / ROWS, 2)}
+
+
+def compare(results, baseline, threshold, alloc_threshold):
+    """Список регрессий относительно baseline: пары (этап, описание)"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline: continue
+        base = baseline[name]
+        if result["rel"] > base["rel"] * (1 + threshold):
+            regressions.append((name, f"{base['ms']} -> {result['ms']} ms, "
+                                      f"{base['rel']} -> {result['rel']} of reference"))
+        if result["peak_kb"] > base["peak_kb"] * (1 + alloc_threshold) + 1:
+            regressions.append((name, f"{base['peak_kb']} -> {result['peak_kb']} KB peak"))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage CPU and allocation micro-benchmarks")
+    parser.add_argument("--stages", nargs="*", help="stage names or prefixes, all stages by default")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed relative slowdown")
+    parser.add_argument("--alloc-threshold", type=float, default=0.10, help="allowed relative growth of peak memory")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="how many times a regressed stage is measured again before it is reported")
+    parser.add_argument("--sev", help="logging severity")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.sev is None: logger.setLevel(logging.ERROR)  # Parsers предупреждают о пустых адресах
+    results, functions = {}, stages(Dataset())
+    for name, fn in functions.items():
+        if args.stages and not any(name.startswith(s) for s in args.stages): continue
+        results[name] = measure(fn, args.repeat)
+        r = results[name]
+        print(f"{name:<28}{r['ms']:>10.3f} ms/1000 rows {r['peak_kb']:>9.1f} KB peak "
+              f"{r['blocks_per_row']:>7.2f} blocks/row")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline is saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+    regressions = compare(results, baseline, args.threshold, args.alloc_threshold)
+    for _ in range(args.confirm):
+        if not regressions: break
+        # всплеск нагрузки соседних процессов редко повторяется: остаётся лучший из замеров этапа
+        for name in {name for name, _ in regressions}:
+            again = measure(functions[name], args.repeat)
+            results[name] = min(results[name], again, key=lambda r: (r["rel"], r["peak_kb"]))
+        regressions = compare(results, baseline, args.threshold, args.alloc_threshold)
+    for name, description in regressions:
+        print(f"REGRESSION {name}: {description}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
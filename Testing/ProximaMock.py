@@ -0,0 +1,296 @@
+"""
+Локальная замена API Proxima для нагрузочных тестов\n
+Отвечает на те же запросы, что и настоящий сервер (query.method/first/skip/filter/include, getwait),
+синтетическими данными заданного размера, с настраиваемой задержкой, временем подготовки данных и ошибками.
+Запуск: python -m Testing.ProximaMock --port 8080 --persons 100000 --latency 0.5
+"""
+import argparse
+import gzip
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Dataset:
+    """
+    Детерминированные синтетические данные: одна и та же запись всегда генерируется одинаково,
+    поэтому страницы можно запрашивать в любом порядке и любое число раз
+    """
+
+    def __init__(self, persons=10000, orgs=5000, posts=500, types=50, seed=0, now=None, history=30 * 86400):
+        """
+        :param persons: число людей (get_persons)
+        :param orgs: число организаций (get_orgs)
+        :param posts: число должностей (get_dict_post)
+        :param types: число типов организаций (get_typeorgs)
+        :param now: timestamp, относительно которого строятся last_update, по умолчанию текущее время
+        :param history: last_update записей равномерно распределены на этом промежутке в секундах до now
+        """
+        self.persons = persons
+        self.orgs = orgs
+        self.posts = posts
+        self.types = types
+        self.seed = seed
+        self.now = int(time.time()) if now is None else now
+        self.history = history
+        self.__recent = {}
+        self.__lock = threading.Lock()
+
+    def __random(self, kind, i):
+        return random.Random(f"{self.seed}:{kind}:{i}")
+
+    def last_update(self, kind, i):
+        return self.now - self.__random(f"{kind}-update", i).randrange(self.history)
+
+    def spec(self, person_id, k):
+        r = self.__random("spec", person_id * 10 + k)
+        return {"object_id": person_id * 10 + k, "name_rus": f"Специальность {r.randrange(200)}",
+                "category": r.randrange(4), "is_main": int(k == 0)}
+
+    def job(self, person_id, k):
+        r = self.__random("job", person_id * 10 + k)
+        return {"object_id": person_id * 10 + k, "person_id": person_id, "post_id": r.randrange(max(self.posts, 1)),
+                "org_id": r.randrange(max(self.orgs, 1)), "is_archive": int(r.random() < 0.1),
+                "is_main": int(k == 0), "status": "Активный"}
+
+    def person(self, i):
+        r = self.__random("person", i)
+        specs = [self.spec(i, k) for k in range(r.randrange(1, 4))]
+        jobs = [self.job(i, k) for k in range(r.randrange(0, 3))]
+        return {"person_id": i, "firstname": f"Имя{r.randrange(500)}", "lastname": f"Фамилия{r.randrange(5000)}",
+                "secondname": f"Отчество{r.randrange(300)}", "status": "Активный",
+                "is_archive": int(r.random() < 0.05), "sex": r.randrange(1, 3),
+                "get_spec": {"fetch": len(specs), "more": False, "result": specs},
+                "get_job": {"fetch": len(jobs), "more": False, "result": jobs}}
+
+    def address(self, org_id):
+        r = self.__random("address", org_id)
+        return {"object_id": org_id, "country": "Россия", "area": f"Область {r.randrange(80)}",
+                "region": f"Район {r.randrange(500)}", "city": f"Город {r.randrange(1000)}",
+                "city_id": r.randrange(1000), "type_street": "ул.", "street": f"Улица {r.randrange(3000)}",
+                "building": None, "house": str(r.randrange(1, 200)), "flat": None}
+
+    def org(self, i):
+        r = self.__random("org", i)
+        phones = [{"phone": f"+7{r.randrange(10 ** 9, 10 ** 10)}"} for _ in range(r.randrange(0, 4))]
+        address = [self.address(i)] if r.random() > 0.01 else []
+        return {"org_id": i, "org_name": f"Организация {i}", "type_org_id": r.randrange(max(self.types, 1)),
+                "form_property_name": "ООО", "code_tax": str(r.randrange(10 ** 9, 10 ** 10)), "status": "Active",
+                "corp_id": None, "center_id": None, "is_archive": int(r.random() < 0.05), "br_nick": None,
+                "get_phoneorg": {"fetch": len(phones), "more": False, "result": phones},
+                "get_address": {"fetch": len(address), "more": False, "result": address}}
+
+    def post(self, i):
+        return {"object_id": i, "name_rus": f"Должность {i}", "type_name": f"Тип {i % 10}"}
+
+    def type(self, i):
+        return {"object_id": i, "name": f"Тип организации {i}", "parent_id": None if i < 5 else i % 5}
+
+    def recent(self, kind, count, update):
+        """Идентификаторы записей kind, обновлённых после update"""
+        with self.__lock:
+            key = (kind, update)
+            if key not in self.__recent:
+                self.__recent[key] = [i for i in range(count) if self.last_update(kind, i) > update]
+            return self.__recent[key]
+
+    def rows(self, method, skip, first, update=0):
+        """Строки страницы method и общее число строк"""
+        def recent(kind, count, wrap):
+            ids = self.recent(kind, count, update)
+            return [{"last_update": self.last_update(kind, i), wrap[0]: {"fetch": 1, "more": False,
+                                                                         "result": [wrap[1](i)]}}
+                    for i in ids[skip:skip + first]], len(ids)
+
+        if method == "get_persons":
+            return [self.person(i) for i in range(skip, min(skip + first, self.persons))], self.persons
+        if method == "get_prepared_persons":
+            return recent("person", self.persons, ("get_persons", self.person))
+        if method == "get_orgs":
+            return [self.org(i) for i in range(skip, min(skip + first, self.orgs))], self.orgs
+        if method == "get_prepared_organizations":
+            return recent("org", self.orgs, ("get_orgs", self.org))
+        # выгрузка мест работы перебирает по два места job(i, 0) и job(i, 1) на человека, независимо от того,
+        # сколько мест (от 0 до 2) у него в get_persons
+        if method == "get_job":
+            return [self.job(i // 2, i % 2) for i in range(skip, min(skip + first, self.persons * 2))], \
+                self.persons * 2
+        if method == "get_prepared_job":
+            return recent("job", self.persons * 2, ("get_job", lambda i: self.job(i // 2, i % 2)))
+        if method == "get_dict_post":
+            return [self.post(i) for i in range(skip, min(skip + first, self.posts))], self.posts
+        if method == "get_typeorgs":
+            return [self.type(i) for i in range(skip, min(skip + first, self.types))], self.types
+        raise KeyError(method)
+
+    def page(self, method, skip=0, first=1000, update=0):
+        """Страница ответа {"fetch", "more", "result"}, как её отдаёт API"""
+        rows, total = self.rows(method, skip, min(first, 1000), update)
+        return {"fetch": len(rows), "more": skip + len(rows) < total, "result": rows}
+
+
+class MockProxima:
+    """HTTP сервер, имитирующий API Proxima поверх Dataset"""
+
+    def __init__(self, dataset=None, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 waiting_share=0.0, ready_delay=1.0, error_share=0.0, error_codes=(503,),
+                 hang_share=0.0, hang_time=30.0, compress=True, reset_share=0.0):
+        """
+        :param dataset: Dataset с данными, по умолчанию Dataset()
+        :param port: 0, чтобы выбрать свободный порт, фактический адрес - в self.url
+        :param latency: задержка каждого ответа в секундах
+        :param jitter: случайная добавка к задержке, от 0 до jitter секунд
+        :param waiting_share: доля запросов, на которые сервер отвечает 201/IN_PROGRESS
+        :param ready_delay: через сколько секунд данные IN_PROGRESS запроса становятся доступны через getwait
+        :param error_share: доля запросов, на которые сервер отвечает ошибкой из error_codes
+        :param hang_share: доля запросов, ответ на которые задерживается на hang_time секунд (таймауты клиента)
+        :param compress: сжимать ответы gzip, если клиент это поддерживает
+        :param reset_share: доля ответов 200, соединение которых обрывается на середине тела
+        """
+        self.dataset = dataset if dataset is not None else Dataset()
+        self.latency = latency
+        self.jitter = jitter
+        self.waiting_share = waiting_share
+        self.ready_delay = ready_delay
+        self.error_share = error_share
+        self.error_codes = tuple(error_codes)
+        self.hang_share = hang_share
+        self.hang_time = hang_time
+        self.compress = compress
+        self.reset_share = reset_share
+        self.requests = 0
+        self.pending = {}
+        self.__ids = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), self.__handler())
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="proxima-mock", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def respond(self, query):
+        """HTTP код и тело ответа на query"""
+        with self.__lock:
+            self.requests += 1
+        if self.error_share and random.random() < self.error_share:
+            return random.choice(self.error_codes), {"resultcode": 500, "errormessage": "Injected error"}
+        if self.hang_share and random.random() < self.hang_share:
+            time.sleep(self.hang_time)
+
+        method = query.get("method")
+        if method == "getwait":
+            return self.__awaited(query.get("object_id"))
+        try:
+            if self.waiting_share and random.random() < self.waiting_share:
+                object_id = next(self.__ids)
+                with self.__lock:
+                    self.pending[object_id] = (time.monotonic() + self.ready_delay, query)
+                return 201, {"status": "IN_PROGRESS", "object_id": object_id}
+            return 200, {method: self.__page(query)}
+        except KeyError:
+            return 200, {"resultcode": 400, "errormessage": f"Unknown method {method}"}
+
+    def __page(self, query):
+        update = query.get("filter", {}).get("last_update", 0)
+        return self.dataset.page(query["method"], query.get("skip", 0), query.get("first", 1000), update)
+
+    def __awaited(self, object_id):
+        with self.__lock:
+            ready_at, query = self.pending.get(object_id, (None, None))
+        if query is None:
+            return 200, {"resultcode": 400, "errormessage": f"Unknown object_id {object_id}"}
+        if time.monotonic() < ready_at:
+            return 200, {"getwait": {"fetch": 1, "more": False,
+                                     "result": [{"status": "IN_PROGRESS", "object_id": object_id}]}}
+        with self.__lock:
+            self.pending.pop(object_id, None)
+        return 200, {"getwait": {"fetch": 1, "more": False, "result": [
+            {"status": "READY", "object_id": object_id, "recordset": {query["method"]: self.__page(query)}}]}}
+
+    def __handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if mock.latency or mock.jitter:
+                    time.sleep(mock.latency + random.uniform(0, mock.jitter))
+                try:
+                    status, info = mock.respond(json.loads(body)["query"])
+                except (ValueError, KeyError):
+                    status, info = 400, {"resultcode": 400, "errormessage": "Bad request"}
+
+                data = json.dumps(info, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                if mock.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    data = gzip.compress(data, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if status == 200 and mock.reset_share and random.random() < mock.reset_share:
+                    self.wfile.write(data[:len(data) // 2])
+                    self.close_connection = True  # клиент получит меньше Content-Length байт
+                    return
+                self.wfile.write(data)
+
+        return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local Proxima API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--persons", type=int, default=10000)
+    parser.add_argument("--orgs", type=int, default=5000)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--types", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, seconds")
+    parser.add_argument("--waiting", type=float, default=0.0, help="share of requests answered IN_PROGRESS")
+    parser.add_argument("--ready-delay", type=float, default=1.0, help="seconds until IN_PROGRESS data is ready")
+    parser.add_argument("--errors", type=float, default=0.0, help="share of requests answered with HTTP 503")
+    parser.add_argument("--hangs", type=float, default=0.0, help="share of requests that hang for --hang-time")
+    parser.add_argument("--hang-time", type=float, default=30.0)
+    parser.add_argument("--resets", type=float, default=0.0, help="share of 200 responses cut off mid-body")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    mock = MockProxima(Dataset(args.persons, args.orgs, args.posts, args.types), args.host, args.port,
+                       latency=args.latency, jitter=args.jitter, waiting_share=args.waiting,
+                       ready_delay=args.ready_delay, error_share=args.errors,
+                       hang_share=args.hangs, hang_time=args.hang_time, reset_share=args.resets)
+    print(f"Serving Proxima mock on {mock.url}")
+    try:
+        mock.start()
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
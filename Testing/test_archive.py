@@ -0,0 +1,86 @@
+"""
+ResponseArchive и ProximaReplay: запись страниц при загрузке из ProximaMock и их воспроизведение\n
+Запуск из корня репозитория: python -m unittest Testing.test_archive
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from Services.Archive import ResponseArchive, ProximaReplay
+from Services.ProximaREST import ProximaREST
+from Services.Retry import RetryPolicy
+from Testing.ProximaMock import Dataset, MockProxima
+
+
+class Rows:
+    """callback загрузки: запоминает все записи каждого аргумента без update_time, которое у повтора другое"""
+
+    def __init__(self):
+        self.tables = None
+        self.lock = threading.Lock()
+
+    def __call__(self, *items):
+        with self.lock:
+            if self.tables is None: self.tables = [[] for _ in items]
+            for table, part in zip(self.tables, items):
+                table.extend(tuple(getattr(o, f) for f in o.FIELDS if f != "update_time") for o in part)
+
+    def sorted(self):
+        return [sorted(table) for table in self.tables]
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="proxima-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def record(self, persons=3000, orgs=1500):
+        loaded = {"persons": Rows(), "hospitals": Rows()}
+        archive = ResponseArchive(self.path)
+        # часть страниц приходит через getwait, в архив они попадают так же
+        with MockProxima(Dataset(persons=persons, orgs=orgs), waiting_share=0.2, ready_delay=0.05) as mock:
+            api = ProximaREST(mock.url, "test", "test", threads=4, page_size=500, min_wait_time=0.05,
+                              retry=RetryPolicy(0), archive=archive)
+            api.get_persons(loaded["persons"])
+            api.get_hospitals(loaded["hospitals"])
+            api.close()
+        archive.close()
+        self.assertFalse(api.failed)
+        return archive, loaded
+
+    def test_round_trip(self):
+        archive, loaded = self.record()
+        replay = ProximaReplay(self.path, writers=2)
+        for name, rows in loaded.items():
+            replayed = Rows()
+            getattr(replay, f"get_{name}")(replayed)
+            self.assertFalse(replay.failed)
+            self.assertTrue(replayed.sorted() == rows.sorted(), name)  # без difflib на тысячах строк
+        self.assertEqual(len(loaded["persons"].tables[0]), 3000)
+
+        replayed = Rows()
+        ProximaReplay(archive.file).get_persons(replayed, skip=1000, nmax=1000)  # один файл и часть страниц
+        self.assertEqual(sorted(p[0] for p in replayed.tables[0]), list(range(1000, 2000)))
+
+    def test_cut_off(self):
+        archive, _ = self.record(persons=5000, orgs=0)
+        size = os.path.getsize(archive.file)
+        with open(archive.file, "r+b") as f:
+            f.truncate(size // 2)  # запуск упал посреди записи
+        replayed = Rows()
+        replay = ProximaReplay(self.path)
+        with self.assertLogs("PROXIMA", "WARNING"):
+            replay.get_persons(replayed)
+        self.assertFalse(replay.failed)
+        uids = sorted(p[0] for p in replayed.tables[0])
+        self.assertTrue(0 < len(uids) < 5000)
+        self.assertEqual(len(uids) % 500, 0)  # только целые страницы
+        self.assertEqual(len(uids), len(set(uids)))
+
+
+if __name__ == "__main__":
+    unittest.main()
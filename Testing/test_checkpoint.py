@@ -0,0 +1,75 @@
+"""
+CheckpointStore и продолжение прерванной загрузки ProximaREST с resume=True против ProximaMock\n
+Запуск из корня репозитория: python -m unittest Testing.test_checkpoint
+"""
+import os
+import tempfile
+import threading
+import unittest
+
+from Services.Checkpoint import CheckpointStore
+from Services.ProximaHelpers import ProximaMethods
+from Services.ProximaREST import ProximaREST
+from Services.Retry import RetryPolicy
+from Testing.ProximaMock import Dataset, MockProxima
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db", prefix="proxima-test-")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_store(self):
+        store = CheckpointStore(self.path)
+        store.mark("persons", 0)
+        store.mark("persons", 1000)
+        store.mark("persons", 1000)
+        store.mark("orgs", 0)
+        store.close()
+
+        store = CheckpointStore(self.path)  # прогресс переживает перезапуск
+        self.assertEqual(store.done("persons"), {0, 1000})
+        store.reset("persons")
+        self.assertEqual((store.done("persons"), store.done("orgs")), (set(), {0}))
+        store.close()
+
+    def test_resume(self):
+        uids, lock = [], threading.Lock()
+
+        def save(persons, specialists, jobs, fail=frozenset()):
+            if fail & {p.uid for p in persons}:
+                raise ValueError("cannot save")
+            with lock:
+                uids.extend(p.uid for p in persons)
+
+        with MockProxima(Dataset(persons=5000)) as mock:
+            def load(resume, fail=frozenset()):
+                store = CheckpointStore(self.path)
+                api = ProximaREST(mock.url, "test", "test", threads=4, page_size=500, retry=RetryPolicy(0),
+                                  checkpoint=store, resume=resume)
+                api.get_persons(lambda *items: save(*items, fail=fail))
+                api.close()
+                return api, store
+
+            api, store = load(False, fail={1200, 3700})  # страницы 1000 и 3500 не записаны
+            self.assertTrue(api.failed)
+            self.assertEqual(len(store.done(ProximaMethods.persons())), 8)
+            self.assertEqual(len(uids), 4000)
+            store.close()
+
+            before = len(uids)
+            api, store = load(True)
+            self.assertFalse(api.failed)
+            # загружаются только незаписанные страницы
+            self.assertEqual(sorted(uids[before:]), list(range(1000, 1500)) + list(range(3500, 4000)))
+            self.assertEqual(store.done(ProximaMethods.persons()), set())  # завершённая загрузка сбрасывает прогресс
+            store.close()
+        self.assertEqual(sorted(uids), sorted(set(uids)))
+        self.assertEqual(len(uids), 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+AimdController и признаки перегрузки, которые ему передаёт ProximaREST\n
+Запуск из корня репозитория: python -m unittest Testing.test_concurrency
+"""
+import unittest
+
+from Services.Concurrency import AimdController
+from Services.ProximaREST import ProximaREST
+from Services.Retry import RetryPolicy
+from Testing.ProximaMock import Dataset, MockProxima
+
+
+class AimdTest(unittest.TestCase):
+    def test_limit(self):
+        aimd = AimdController(8, 2, initial=4, cooldown=0)
+        for _ in range(8):
+            aimd.release(aimd.acquire(), latency=0.1)
+        self.assertEqual(aimd.limit, 5)  # примерно +1 за каждые limit успешных запросов
+        aimd.release(aimd.acquire(), ok=False)
+        self.assertEqual(aimd.limit, 2)
+        aimd.release(aimd.acquire(), ok=False)
+        self.assertEqual(aimd.limit, 2)  # не ниже minimum
+
+    def test_latency(self):
+        aimd = AimdController(8, 1, initial=4, cooldown=0, min_latency=0.5)
+        aimd.release(aimd.acquire(), latency=0.2)
+        aimd.release(aimd.acquire(), latency=0.4)  # выше базовой, но меньше min_latency
+        self.assertEqual(aimd.errors, 0)
+        aimd.release(aimd.acquire(), latency=2.0)
+        self.assertEqual(aimd.errors, 1)
+        self.assertAlmostEqual(aimd.base_latency, 0.22)  # задержка перегрузки в базовую не входит
+
+    def test_rate_limited(self):
+        # 429 повторяется и, как 5xx, снижает число одновременных запросов
+        for code in (429, 503):
+            with MockProxima(Dataset(persons=2000), error_share=0.3, error_codes=(code,)) as mock:
+                api = ProximaREST(mock.url, "test", "test", threads=4, page_size=250,
+                                  retry=RetryPolicy(20, 5, base_delay=0.01, max_delay=0.05))
+                records = []
+                api.get_persons(lambda persons, specialists, jobs: records.append(len(persons)))
+                api.close()
+            self.assertFalse(api.failed)
+            self.assertEqual(sum(records), 2000)
+            self.assertGreater(api.concurrency.errors, 0, code)
+
+
+if __name__ == "__main__":
+    unittest.main()
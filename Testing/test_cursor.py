@@ -0,0 +1,83 @@
+"""
+PageCursor: общая выдача страниц потокам загрузки, пропуск загруженных страниц, остановка на последней
+странице и после ошибки\n
+Запуск из корня репозитория: python -m unittest Testing.test_cursor
+"""
+import threading
+import time
+import unittest
+
+from Services.ProximaHelpers import PageCursor
+from Services.ProximaREST import ProximaREST
+from Services.Retry import RetryPolicy
+from Testing.ProximaMock import Dataset, MockProxima
+
+
+def drain(cursor, threads, delays=(), last=None):
+    """
+    Забирает страницы cursor в threads потоках, поток i тратит на страницу delays[i] секунд\n
+    :param last: смещение последней страницы, как если бы на ней сервер ответил more=False
+    :return: список смещений, полученных каждым потоком
+    """
+    taken = [[] for _ in range(threads)]
+
+    def work(i):
+        offset = cursor.next()
+        while offset is not None:
+            taken[i].append(offset)
+            if offset == last: cursor.finish(offset)
+            time.sleep(delays[i] if i < len(delays) else 0)
+            offset = cursor.next()
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+    return taken
+
+
+class PageCursorTest(unittest.TestCase):
+    def test_each_page_once(self):
+        taken = drain(PageCursor(0, 100, nmax=10000), 8)
+        pages = sorted(o for t in taken for o in t)
+        self.assertEqual(pages, list(range(0, 10000, 100)))
+
+    def test_work_stealing(self):
+        # медленный поток не задерживает остальные: его доля страниц достаётся быстрым
+        taken = drain(PageCursor(0, 100, nmax=4000), 4, delays=(0.2, 0.001, 0.001, 0.001))
+        self.assertLessEqual(len(taken[0]), 2)
+        self.assertEqual(sum(map(len, taken)), 40)
+
+    def test_done(self):
+        cursor = PageCursor(100, 100, nmax=600, done={100, 300, 400})
+        self.assertEqual([cursor.next() for _ in range(4)], [200, 500, 600, None])
+
+    def test_finish(self):
+        cursor = PageCursor(0, 100)
+        taken = drain(cursor, 4, last=1500)
+        pages = sorted(o for t in taken for o in t)
+        self.assertEqual(pages[:16], list(range(0, 1600, 100)))  # после последней страницы могли взять ещё
+        self.assertLessEqual(len(pages), 16 + 3)
+        self.assertIsNone(cursor.next())
+        self.assertFalse(cursor.is_more)
+
+    def test_fail(self):
+        cursor = PageCursor(0, 100)
+        self.assertEqual((cursor.next(), cursor.next()), (0, 100))
+        cursor.fail()
+        self.assertIsNone(cursor.next())
+        self.assertTrue(cursor.is_more)  # данные не получены до конца
+
+    def test_failed_load(self):
+        # страница без повторов завершилась ошибкой: остальные потоки не берут новые страницы
+        with MockProxima(Dataset(persons=20000), error_share=0.2) as mock:
+            api = ProximaREST(mock.url, "test", "test", threads=4, page_size=100, retry=RetryPolicy(0))
+            pages = []
+            is_more = api.get_persons(lambda persons, specialists, jobs: pages.append(len(persons)))
+            api.close()
+        self.assertTrue(api.failed)
+        self.assertTrue(is_more)
+        self.assertLess(len(pages), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Dedup: повторы uid внутри страницы и на разных страницах, в том числе с равным и более старым update_time\n
+Запуск из корня репозитория: python -m unittest Testing.test_dedup
+"""
+import datetime
+import unittest
+
+from Services.Dedup import Dedup
+from Models.Batch import Batch
+from Models.Person import Person
+
+OLD, NEW = datetime.datetime(2020, 1, 1), datetime.datetime(2021, 1, 1)
+
+
+def person(uid, name, update_time=NEW):
+    return Person(name, "lastname", "secondname", uid, update_time)
+
+
+class DedupTest(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+        self.dedup = Dedup(lambda persons: self.written.append([(p.uid, p.firstname) for p in persons]))
+
+    def test_page(self):
+        # в пакете остаётся самая поздняя копия, при равном времени - последняя, как в SqlAlc.newest
+        self.dedup([person(1, "first"), person(2, "newer"), person(1, "last"), person(2, "older", OLD)])
+        self.assertEqual(self.written, [[(2, "newer"), (1, "last")]])  # порядок записей в пакете сохраняется
+        self.assertEqual(self.dedup.dropped, {"Person": 2})
+
+    def test_equal_time_across_pages(self):
+        # у всех записей полной загрузки одно время: повтор с другой страницы не пишется ещё раз
+        self.dedup([person(1, "first"), person(2, "first")])
+        self.dedup([person(2, "again"), person(3, "first")])
+        self.assertEqual(self.written, [[(1, "first"), (2, "first")], [(3, "first")]])
+
+    def test_out_of_order_pages(self):
+        self.dedup([person(1, "newer"), person(2, "older", OLD)])
+        self.dedup([person(1, "older", OLD), person(2, "newer")])  # старая копия отбрасывается, новая пишется
+        self.assertEqual(self.written, [[(1, "newer"), (2, "older")], [(2, "newer")]])
+
+    def test_batch(self):
+        batch = Batch(Person)
+        for p in (person(1, "first"), person(1, "last"), person(2, "first")):
+            batch.append(tuple(getattr(p, f) for f in Person.FIELDS))
+        self.dedup(batch)
+        self.dedup(batch.select([2]))
+        self.assertEqual(self.written, [[(1, "last"), (2, "first")], []])
+
+    def test_capacity(self):
+        dedup = Dedup(lambda persons: self.written.append([p.uid for p in persons]), capacity=4)
+        dedup([person(uid, "first") for uid in range(6)])  # uid 0-3 вытеснены из памяти
+        dedup([person(0, "again"), person(5, "again")])
+        self.assertEqual(self.written[-1], [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Полная загрузка через теневые таблицы SqlAlc на SQLite: замена, удаление повторов, отмена и продолжение,
+отказ для таблиц с лишними индексами или представлениями и отложенные хэши ChangeIndex\n
+Запуск из корня репозитория: python -m unittest Testing.test_full_load
+"""
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from Services.SqlAlc import SqlAlc
+from Services.ChangeIndex import ChangeIndex, ChangeFilter
+from Models.Person import Person
+
+OLD, NEW = datetime.datetime(2020, 1, 1), datetime.datetime(2021, 1, 1)
+
+
+def person(uid, name, update_time=NEW):
+    return Person(name, "lastname", "secondname", uid, update_time)
+
+
+class FullLoadTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db", prefix="proxima-test-")
+        os.close(fd)
+        self.sql = SqlAlc(f"sqlite:///{self.path}", verbose=False)
+        self.sql.create_tables()
+        self.sql.update_many_employees([person(1, "live", OLD), person(2, "live", OLD), person(3, "gone", OLD)])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def query(self, sql):
+        with sqlite3.connect(self.path) as c:
+            return c.execute(sql).fetchall()
+
+    def names(self, table="Employee"):
+        return dict(self.query(f"SELECT uid, firstname FROM {table}"))
+
+    def tables(self):
+        return {name for name, in self.query("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def test_swap(self):
+        self.assertFalse(self.sql.begin_full_load("Employee"))
+        self.sql.update_many_employees([person(1, "new"), person(2, "new"), person(4, "new")])
+        self.assertEqual(self.names(), {1: "live", 2: "live", 3: "gone"})  # читатели видят прежние данные
+        self.sql.finish_full_load("Employee")
+
+        self.assertEqual(self.names(), {1: "new", 2: "new", 4: "new"})
+        self.assertNotIn("Employee_load", self.tables())
+        self.assertNotIn("Employee_old", self.tables())
+        self.assertEqual(self.sql.shadow_loss("Employee"), [])  # следующая загрузка тоже возможна
+        self.sql.update_many_employees([person(4, "updated")])
+        self.assertEqual(self.names()[4], "updated")
+
+    def test_dedup(self):
+        self.sql.begin_full_load("Employee")
+        self.sql.update_many_employees([person(1, "newer"), person(1, "older", OLD), person(2, "first")])
+        self.sql.update_many_employees([person(2, "last"), person(1, "oldest", OLD)])
+        self.sql.finish_full_load("Employee")
+
+        self.assertEqual(self.names(), {1: "newer", 2: "last"})
+        with self.assertRaises(sqlite3.IntegrityError):  # ключ uid построен
+            self.query("INSERT INTO Employee (uid, firstname) VALUES (1, 'duplicate')")
+
+    def test_cancel_and_resume(self):
+        self.sql.begin_full_load("Employee")
+        self.sql.update_many_employees([person(1, "part")])
+        self.sql.cancel_full_load("Employee")
+        self.assertEqual(self.names(), {1: "live", 2: "live", 3: "gone"})
+        self.assertEqual(self.names("Employee_load"), {1: "part"})
+
+        self.sql.update_many_employees([person(2, "in place")])  # без полной загрузки пишется в таблицу
+        self.assertEqual(self.names()[2], "in place")
+
+        self.assertTrue(self.sql.begin_full_load("Employee", resume=True))
+        self.sql.update_many_employees([person(2, "rest")])
+        self.sql.finish_full_load("Employee")
+        self.assertEqual(self.names(), {1: "part", 2: "rest"})
+
+    def test_cancel_drop(self):
+        self.sql.begin_full_load("Employee")
+        self.sql.update_many_employees([person(1, "part")])
+        self.sql.cancel_full_load("Employee", drop=True)
+        self.assertNotIn("Employee_load", self.tables())
+        self.assertFalse(self.sql.begin_full_load("Employee", resume=True))
+        self.sql.cancel_full_load("Employee", drop=True)
+
+    def test_refuses_to_lose_indexes(self):
+        self.query("CREATE INDEX employee_lastname ON Employee (lastname)")
+        self.assertEqual(self.sql.shadow_loss("Employee"), ["Employee index employee_lastname"])
+        with self.assertRaises(ValueError):
+            self.sql.begin_full_load("Employee")
+        self.assertNotIn("Employee_load", self.tables())
+        self.sql.update_many_employees([person(1, "in place")])
+        self.assertEqual(self.names()[1], "in place")
+
+    def test_refuses_to_lose_views(self):
+        # после переименования представление читало бы удаляемую Employee_old
+        self.query("CREATE VIEW employee_names AS SELECT uid, firstname FROM employee")
+        self.assertEqual(self.sql.shadow_loss("Employee", "Jobs"), ["Employee view employee_names"])
+        with self.assertRaises(ValueError):
+            self.sql.begin_full_load("Employee")
+        self.assertEqual(dict(self.query("SELECT * FROM employee_names")), {1: "live", 2: "live", 3: "gone"})
+
+
+class DeferredHashesTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db", prefix="proxima-test-")
+        os.close(fd)
+        self.index = ChangeIndex(self.path)
+        self.written = []
+        self.filter = ChangeFilter(lambda persons: self.written.append([p.firstname for p in persons]), self.index)
+        self.filter([person(1, "live"), person(2, "live")])
+
+    def tearDown(self):
+        self.index.close()
+        os.remove(self.path)
+
+    def test_discard(self):
+        self.index.defer("Person")
+        self.filter([person(1, "live"), person(2, "shadow")])
+        self.index.discard("Person")
+        self.filter([person(1, "live"), person(2, "live")])  # в рабочих таблицах прежние записи
+        self.assertEqual(self.written, [["live", "live"], ["live", "shadow"], []])
+
+    def test_commit(self):
+        self.index.defer("Person")
+        self.filter([person(1, "live")])  # в теневую таблицу пишутся все записи
+        self.filter([person(1, "live")])  # повтор в той же загрузке пропускается
+        self.index.commit("Person")
+        self.filter([person(1, "live"), person(2, "live")])  # uid 2 не было в новых таблицах
+        self.assertEqual(self.written, [["live", "live"], ["live"], [], ["live"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
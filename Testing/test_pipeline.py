@@ -0,0 +1,85 @@
+"""
+Pipeline: запись страниц в потоках записи, объединение небольших страниц (coalesce, linger) и подсчёт ошибок\n
+Запуск из корня репозитория: python -m unittest Testing.test_pipeline
+"""
+import threading
+import time
+import unittest
+
+from Services.Pipeline import Pipeline
+from Models.Batch import Batch
+from Models.Person import Person
+
+
+def batch(uids):
+    b = Batch(Person)
+    for uid in uids:
+        b.append(tuple(getattr(Person("name", "lastname", "secondname", uid), f) for f in Person.FIELDS))
+    return b
+
+
+class Sink:
+    """callback Pipeline: запоминает размеры пакетов, падает на пакетах с uid из fail"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, persons, jobs):
+        if self.fail & {p.uid for p in persons}:
+            raise ValueError("cannot save")
+        with self.lock:
+            self.calls.append((len(persons), len(jobs)))
+
+
+class PipelineTest(unittest.TestCase):
+    def run_pages(self, sink, pages, **kwargs):
+        saved = []
+        with Pipeline(sink, **kwargs) as pipeline:
+            for i, (persons, jobs) in enumerate(pages):
+                pipeline.put(persons, jobs, done=lambda i=i: saved.append(i))
+        return pipeline, saved
+
+    def test_pages(self):
+        sink = Sink()
+        pipeline, saved = self.run_pages(sink, [(batch(range(i, i + 10)), [i]) for i in range(0, 100, 10)],
+                                         writers=3, size=2)
+        self.assertEqual(sorted(sink.calls), [(10, 1)] * 10)
+        self.assertEqual(sorted(saved), list(range(10)))
+        self.assertEqual(pipeline.errors, 0)
+
+    def test_coalesce(self):
+        sink = Sink()
+        pages = [(batch(range(i, i + 10)), [i]) for i in range(0, 100, 10)]
+        _, saved = self.run_pages(sink, pages, coalesce=25, linger=60)
+        # пакет записывается, как только одна из таблиц набрала coalesce записей, остаток - при close
+        self.assertEqual(sink.calls, [(30, 3), (30, 3), (30, 3), (10, 1)])
+        self.assertEqual(saved, list(range(10)))
+
+    def test_linger(self):
+        sink = Sink()
+        with Pipeline(sink, coalesce=1000, linger=0.1) as pipeline:
+            pipeline.put(batch([1]), [1])
+            time.sleep(0.5)
+            self.assertEqual(sink.calls, [(1, 1)])  # первая страница буфера не ждёт дольше linger
+            pipeline.put(batch([2]), [2])
+        self.assertEqual(sink.calls, [(1, 1), (1, 1)])
+
+    def test_errors(self):
+        sink = Sink(fail={5, 55})
+        pages = [(batch([i]), [i]) for i in range(100)]
+        pipeline, saved = self.run_pages(sink, pages, writers=4)
+        self.assertEqual(pipeline.errors, 2)
+        self.assertEqual(sorted(saved), [i for i in range(100) if i not in (5, 55)])  # done только для записанных
+
+    def test_coalesced_errors(self):
+        # ошибка объединённого пакета - одна ошибка, done не вызывается ни для одной из его страниц
+        sink = Sink(fail={3})
+        pipeline, saved = self.run_pages(sink, [(batch([i]), [i]) for i in range(6)], coalesce=3, linger=60)
+        self.assertEqual(pipeline.errors, 1)
+        self.assertEqual(saved, [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
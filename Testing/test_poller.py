@@ -0,0 +1,77 @@
+"""
+AwaitingPoller: повторные опросы, ожидание в join и ошибки\n
+Запуск из корня репозитория: python -m unittest Testing.test_poller
+"""
+import threading
+import time
+import unittest
+
+from Services.Poller import AwaitingPoller, ReadinessModel
+from Services.ProximaHelpers import WaitingException
+from Services.Retry import RetryPolicy
+
+
+class Polls:
+    """Функция опроса: первые waits опросов object_id данные не готовы, каждый опрос длится duration секунд"""
+
+    def __init__(self, waits=1, duration=0.0, errors=0):
+        self.waits, self.duration, self.errors = waits, duration, errors
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, object_id, method, attempt):
+        with self.lock:
+            calls = self.calls[object_id] = self.calls.get(object_id, 0) + 1
+        time.sleep(self.duration)
+        if calls <= self.errors:
+            raise ConnectionError("reset")
+        if calls <= self.errors + self.waits:
+            raise WaitingException(object_id)
+        return {"object_id": object_id}
+
+
+class PollerTest(unittest.TestCase):
+    def join(self, poller, timeout=10):
+        thread = threading.Thread(target=poller.join, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), "join не дождался опросов")
+
+    def test_reschedule_after_idle(self):
+        # опрос дольше max_interval: поток планирования не должен завершиться, пока задача не вернулась в очередь
+        polls, ready = Polls(waits=1, duration=1.0), []
+        poller = AwaitingPoller(polls, ReadinessModel(0.1, 0.5))
+        poller.submit(1, "persons", ready.append)
+        self.join(poller)
+        self.assertEqual(ready, [{"object_id": 1}])
+        self.assertEqual(polls.calls, {1: 2})
+        poller.close()
+
+    def test_many(self):
+        polls, ready = Polls(waits=2), []
+        poller = AwaitingPoller(polls, ReadinessModel(0.01, 0.05), capacity=3, workers=2)
+        for object_id in range(10):
+            poller.submit(object_id, "persons", ready.append)
+        self.join(poller)
+        self.assertEqual(sorted(data["object_id"] for data in ready), list(range(10)))
+        self.assertEqual(poller.pending, 0)
+        poller.close()
+
+    def test_errors(self):
+        errors, ready = [], []
+        retry = RetryPolicy(retries=1, base_delay=0.01, max_delay=0.01)
+        poller = AwaitingPoller(Polls(waits=0, errors=1), ReadinessModel(0.01, 0.05), retry)
+        poller.submit(1, "persons", ready.append, errors.append)  # одна ошибка повторяется
+        self.join(poller)
+        self.assertEqual((ready, errors), ([{"object_id": 1}], []))
+
+        poller.retry = RetryPolicy(0)
+        poller.submit(2, "persons", ready.append, errors.append)
+        self.join(poller)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ConnectionError)
+        poller.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Потоковый разбор страниц (ProximaREST с stream=True) против ProximaMock: обрывы соединения посреди ответа
+повторяются, ответ getwait IN_PROGRESS распознаётся как ожидание\n
+Запуск из корня репозитория: python -m unittest Testing.test_stream
+"""
+import io
+import json
+import threading
+import unittest
+
+import Services.ProximaJson as ProximaJson
+from Services.ProximaHelpers import WaitingException
+from Services.ProximaREST import ProximaREST
+from Services.Retry import RetryPolicy
+from Testing.ProximaMock import Dataset, MockProxima
+
+
+def body(info):
+    return io.BytesIO(json.dumps(info).encode("utf-8"))
+
+
+@unittest.skipUnless(ProximaJson.can_stream(), "ijson is not installed")
+class StreamTest(unittest.TestCase):
+    def test_iter_page(self):
+        page = ProximaJson.iter_page(body({"m": {"fetch": 2, "more": False, "result": [{"a": 1}, [2]]}}), "m")
+        self.assertEqual((page["fetch"], page["more"], list(page["result"])), (2, False, [{"a": 1}, [2]]))
+
+    def test_waiting(self):
+        waiting = {"getwait": {"fetch": 1, "more": False, "result": [{"status": "IN_PROGRESS", "object_id": 7}]}}
+        with self.assertRaises(WaitingException) as raised:
+            ProximaJson.iter_page(body(waiting), "m")
+        self.assertEqual(raised.exception.object_id, 7)
+
+    def test_resets(self):
+        uids, lock = [], threading.Lock()
+
+        def save(persons, specialists, jobs):
+            with lock:
+                uids.extend(p.uid for p in persons)
+
+        with MockProxima(Dataset(persons=3000), reset_share=0.3) as mock:
+            api = ProximaREST(mock.url, "test", "test", threads=4, page_size=250, stream=True,
+                              retry=RetryPolicy(20, 5, base_delay=0.01, max_delay=0.05))
+            self.assertTrue(api.stream)
+            api.get_persons(save)
+            api.close()
+        self.assertFalse(api.failed)
+        self.assertEqual(sorted(uids), sorted(set(uids)))
+        self.assertEqual(len(uids), 3000)
+
+
+if __name__ == "__main__":
+    unittest.main()
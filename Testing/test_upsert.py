@@ -0,0 +1,77 @@
+"""
+Запись пакетов SqlAlc на SQLite: staged_upsert, правило «новее или равное побеждает» и счётчики
+inserted/updated/skipped\n
+Запуск из корня репозитория: python -m unittest Testing.test_upsert
+"""
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from Services.SqlAlc import SqlAlc
+from Models.Batch import Batch
+from Models.Person import Person
+
+OLD, MID, NEW = datetime.datetime(2020, 1, 1), datetime.datetime(2021, 1, 1), datetime.datetime(2022, 1, 1)
+
+
+def person(uid, name, update_time):
+    return Person(name, "lastname", "secondname", uid, update_time)
+
+
+def batch(persons):
+    b = Batch(Person)
+    for p in persons:
+        b.append(tuple(getattr(p, f) for f in Person.FIELDS))
+    return b
+
+
+class UpsertTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db", prefix="proxima-test-")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def sql(self, bulk=True):
+        sql = SqlAlc(f"sqlite:///{self.path}", verbose=False, bulk=bulk)
+        sql.create_tables()
+        sql.update_many_employees([person(1, "first", MID), person(2, "first", MID), person(3, "first", MID)])
+        return sql
+
+    def names(self):
+        with sqlite3.connect(self.path) as c:
+            return dict(c.execute("SELECT uid, firstname FROM Employee"))
+
+    def page(self):
+        return [person(1, "newer", NEW),
+                person(2, "older", OLD),  # пропускается
+                person(3, "equal", MID),  # при равном времени побеждает записанная последней
+                person(4, "first", NEW),
+                person(4, "second", NEW)]  # повтор внутри пакета, остаётся последняя копия
+
+    def test_counts(self):
+        sql = self.sql()
+        self.assertEqual(sql.stats["Employee"], {"input": 3, "inserted": 3, "updated": 0, "skipped": 0})
+        sql.update_many_employees(self.page())
+        self.assertEqual(self.names(), {1: "newer", 2: "first", 3: "equal", 4: "second"})
+        self.assertEqual(sql.stats["Employee"], {"input": 7, "inserted": 4, "updated": 2, "skipped": 1})
+
+    def test_batch(self):
+        sql = self.sql()
+        sql.update_many_employees(batch(self.page()))
+        self.assertEqual(self.names(), {1: "newer", 2: "first", 3: "equal", 4: "second"})
+        self.assertEqual(sql.stats["Employee"], {"input": 7, "inserted": 4, "updated": 2, "skipped": 1})
+
+    def test_row_upsert(self):
+        # без bulk записи обновляются по одной с тем же правилом, известно только число входных записей
+        sql = self.sql(bulk=False)
+        sql.update_many_employees(self.page())
+        self.assertEqual(self.names(), {1: "newer", 2: "first", 3: "equal", 4: "second"})
+        self.assertEqual(sql.stats["Employee"], {"input": 8})
+
+
+if __name__ == "__main__":
+    unittest.main()
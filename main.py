@@ -1,75 +1,168 @@
 from Services.ProximaREST import ProximaREST
+from Services.ProximaHelpers import ProximaMethods
+from Services.Checkpoint import CheckpointStore
+from Services.Archive import ResponseArchive, ProximaReplay
+from Services.Dedup import Dedup
+from Services.ChangeIndex import ChangeIndex, ChangeFilter
+from Services.PartitionedWriter import PartitionedWriter
 from Settings.Manager import *
 from Services.SqlAlc import *
 
 
-sql = SqlAlc(get_sqlalchemy_dsn(), True)
-api = ProximaREST(url=get_api_url(),
-                  key=get_api_key(),
-                  sign=get_api_sign(),
-                  proxy=None,
-                  wait_time=get_api_wait_time(),
-                  retries=get_max_retries(),
-                  timeout=get_timeout(),
-                  threads=get_parallel())
+# создаются в main(): с методом запуска spawn процессы ParsePool импортируют этот модуль заново
+sql = api = changes = None
 
 
+# ошибки записи логирует Pipeline, такие страницы не отмечаются в CheckpointStore
 def save_hospitals(hospitals, addresses):
-    try:
-        sql.update_many_hospitals(hospitals)
-        sql.update_many_addresses(addresses)
-    except Exception as e:
-        logger.error(e)
+    sql.update_many_hospitals(hospitals)
+    sql.update_many_addresses(addresses)
 
 
 def save_persons(persons, specialists, jobs):
-    try:
-        sql.update_many_employees(persons)
-        sql.update_many_specs(specialists)
-        sql.update_many_jobs(jobs)
-    except Exception as e:
-        logger.error(e)
+    sql.update_many_employees(persons)
+    sql.update_many_specs(specialists)
+    sql.update_many_jobs(jobs)
 
 
 def save_posts(posts):
-    try:
-        sql.update_many_posts(posts)
-    except Exception as e:
-        logger.error(e)
+    sql.update_many_posts(posts)
 
 
 def save_jobs(jobs):
-    try:
-        sql.update_many_jobs(jobs)
-    except Exception as e:
-        logger.error(e)
+    sql.update_many_jobs(jobs)
 
 
 def save_types(types):
-    try:
-        sql.update_many_types(types)
-    except Exception as e:
-        logger.error(e)
-
+    sql.update_many_types(types)
+
+
+def interrupted(method):
+    """True, если с --resume нужно продолжить полную загрузку, прерванную в прошлый раз"""
+    return args.resume and api.checkpoint is not None and len(api.checkpoint.done(method)) != 0
+
+
+def full_load(get, callback, method, tables, entities, nmax):
+    """
+    Полная загрузка через теневые таблицы: пока она идёт, читатели видят прежние данные\n
+    Незавершённая загрузка оставляет теневые таблицы, с --resume она продолжается в них. Если теневые таблицы
+    потеряли бы индексы, ограничения, триггеры, права или представления (SqlAlc.shadow_loss), записи обновляются
+    на месте, как раньше
+    :param get: метод api.get_*
+    :param tables: таблицы, которые заполняет callback
+    :param entities: типы записей для ChangeIndex. Их хэши откладываются до замены таблиц: иначе после
+        отменённой загрузки недавние пропускали бы записи, которые так и не попали в рабочие таблицы
+    :param nmax: ограничение на число записей при обновлении на месте. Загрузка в теневые таблицы им не
+        ограничивается: замена удалила бы все записи после nmax, превышение только пишется в лог
+    :return: True, если новые таблицы заменили прежние или все записи обновлены на месте
+    """
+    lost = sql.shadow_loss(*tables)
+    if lost:
+        logger.warning(f"Shadow tables would lose {', '.join(lost)}, updating {', '.join(tables)} in place.")
+        if not interrupted(method): changes.reset(*entities)
+        get(callback, nmax=nmax)
+        return not api.failed
+    if not sql.begin_full_load(*tables, resume=interrupted(method)):
+        if api.checkpoint is not None: api.checkpoint.reset(method)
+    changes.defer(*entities)
+    get(callback, nmax=None)
+    if api.failed:
+        sql.cancel_full_load(*tables)
+        changes.discard(*entities)
+        logger.warning(f"Full load of {', '.join(tables)} is incomplete, shadow tables are kept, "
+                       f"run with --resume to continue it.")
+        return False
+    sql.finish_full_load(*tables)
+    changes.commit(*entities)
+    loaded = sql.count_items(tables[0]) or 0
+    if loaded > nmax: logger.warning(f"Full load of {tables[0]} has {loaded} records, more than the limit {nmax}.")
+    return True
+
+
+def main():
+    global sql, api, changes
+    sql = SqlAlc(get_sqlalchemy_dsn(), True, writers=get_db_writers())
+    archive = None
+    if args.replay is not None:
+        if args.record is not None: logger.warning("--record is ignored with --replay.")
+        api = ProximaReplay(args.replay, writers=get_writers(), queue_size=get_queue_size(),
+                            coalesce=get_coalesce(), linger=get_linger())
+    else:
+        archive = None if args.record is None else ResponseArchive(args.record)
+        api = ProximaREST(url=get_api_url(),
+                          key=get_api_key(),
+                          sign=get_api_sign(),
+                          proxy=None,
+                          wait_time=get_api_wait_time(),
+                          min_wait_time=get_api_min_wait_time(),
+                          retries=get_max_retries(),
+                          timeout=get_timeout(),
+                          threads=get_parallel(),
+                          min_threads=get_min_parallel(),
+                          pool_size=get_pool_size(),
+                          writers=get_writers(),
+                          queue_size=get_queue_size(),
+                          coalesce=get_coalesce(),
+                          linger=get_linger(),
+                          parse_workers=get_parse_workers(),
+                          checkpoint=CheckpointStore(get_checkpoint_path()),
+                          resume=args.resume,
+                          archive=archive)
 
-if __name__ == "__main__":
     last_update = get_update_time()
     logger.info(f"Launching, last update {convert_time(last_update)}.")
-
-    if sql.count_items("Employee") == 0 or sql.count_items("Jobs") == 0 or sql.count_items("Specialists") == 0:
-        logger.info("Employee/Jobs/Specialists is empty, repopulating it.")
-        api.get_persons(save_persons, nmax=600000)
+    # неизменившиеся с прошлого запуска записи не пишутся в БД, с --rewrite пишутся все
+    changes = ChangeIndex(get_change_index_path())
+    if args.rewrite: changes.reset("Person", "Spec", "Job", "Hospital", "Address")
+    # страница делится по uid между SQL.WRITERS соединениями, которые пишут её параллельно
+    persons_writer, hospitals_writer = (PartitionedWriter(save_persons, sql.writers),
+                                        PartitionedWriter(save_hospitals, sql.writers))
+    persons_sink, hospitals_sink = ChangeFilter(persons_writer, changes), ChangeFilter(hospitals_writer, changes)
+    # страницы смещаются, пока данные меняются во время загрузки: повторы uid внутри страницы убираются,
+    # а повтор с более поздней страницы записывается, только если его update_time новее прежнего
+    persons, hospitals = Dedup(persons_sink, get_dedup_capacity()), Dedup(hospitals_sink, get_dedup_capacity())
+
+    # RUNTIME.UPDATE сдвигается, только если все загрузки получили и записали все страницы, иначе
+    # изменения с пропущенных страниц больше не попали бы в недавние
+    failed = False
+    persons_empty = sql.count_items("Employee") == 0 or sql.count_items("Jobs") == 0 or \
+        sql.count_items("Specialists") == 0
+    if interrupted(ProximaMethods.persons()) or persons_empty or args.full:
+        if persons_empty: logger.info("Employee/Jobs/Specialists is empty, repopulating it.")
+        failed |= not full_load(api.get_persons, persons, ProximaMethods.persons(),
+                                ("Employee", "Specialists", "Jobs"), ("Person", "Spec", "Job"), 600000)
     else:
-        api.get_recent_persons(save_persons, nmax=30000, update=last_update)
-
-    if sql.count_items("Addresses") == 0 or sql.count_items("Hospitals") == 0:
-        logger.info("Addresses/Hospitals is empty, repopulating it.")
-        api.get_hospitals(save_hospitals, nmax=400000)
+        api.get_recent_persons(persons, nmax=30000, update=last_update)
+        failed |= api.failed
+    persons.report()
+    persons_sink.report()
+
+    hospitals_empty = sql.count_items("Addresses") == 0 or sql.count_items("Hospitals") == 0
+    if interrupted(ProximaMethods.hospitals()) or hospitals_empty or args.full:
+        if hospitals_empty: logger.info("Addresses/Hospitals is empty, repopulating it.")
+        failed |= not full_load(api.get_hospitals, hospitals, ProximaMethods.hospitals(),
+                                ("Hospitals", "Addresses"), ("Hospital", "Address"), 400000)
     else:
-        api.get_recent_hospitals(save_hospitals, nmax=30000, update=last_update)
+        api.get_recent_hospitals(hospitals, nmax=30000, update=last_update)
+        failed |= api.failed
+    hospitals.report()
+    hospitals_sink.report()
 
     api.get_types(save_types, nmax=1000)
+    failed |= api.failed
     api.get_posts(save_posts, nmax=5000)
-
-    reset_update_time()
+    failed |= api.failed
+
+    sql.report()
+    persons_writer.close()
+    hospitals_writer.close()
+    api.close()
+    changes.close()
+    if archive is not None: archive.close()
+    if failed: logger.warning(f"Some pages are not saved, last update stays {convert_time(last_update)}.")
+    elif args.replay is None: reset_update_time()
     logger.info("Done.")
+
+
+if __name__ == "__main__":
+    main()